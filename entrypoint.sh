@@ -6,5 +6,5 @@ if [ "$1" = "cli" ]; then
     PYTHONPATH=/app python /app/src/cli_app.py "${@:2}"
 else
     # Run the API server
-    uvicorn src.api.app:app --host 0.0.0.0 --port 8000
+    gunicorn src.api.app:app -c /app/gunicorn_conf.py
 fi
\ No newline at end of file
@@ -0,0 +1,28 @@
+# gunicorn_conf.py
+
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+
+# One worker by default: upload status, the loaded vector store and every cache live in
+# the worker's memory, so after an upload only the worker that tracked it would reload
+# the store, and status polls landing on another worker would 404. Raise this only once
+# that state is shared between workers
+workers = int(os.getenv("GUNICORN_WORKERS", "1"))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Import the application once in the master so workers share its modules copy-on-write;
+# the QA system itself is built lazily inside each worker (see get_qa_system)
+preload_app = True
+
+# PDF uploads return immediately, but first LLM calls can be slow on a cold model
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+
+# Development conveniences stay opt-in; reloading also defeats preload_app
+reload = os.getenv("GUNICORN_RELOAD", "false").lower() == "true"
+loglevel = os.getenv("GUNICORN_LOGLEVEL", "info")
+
+# Stream access logs to stdout for the container log driver instead of a file on disk
+accesslog = "-"
@@ -1,20 +1,38 @@
-from fastapi import FastAPI, HTTPException, Header, Query, Depends, File, UploadFile
+from fastapi import (
+    FastAPI,
+    HTTPException,
+    Header,
+    Query,
+    Depends,
+    File,
+    Request,
+    Response,
+    UploadFile,
+)
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel, UUID4, validator
-from typing import List, Optional
-from src.core.qa_system import QASystem
-from src.config import Config
+from typing import Dict, List, Optional
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from src.core.ingest_worker import ingest_pdf
+from src.core.qa_system import get_qa_system
+from src.config import ensure_dirs, get_config
 from src.utils.error_handler import QASystemError
 import os
 import uuid
 import logging
 import tempfile
 import asyncio
+import aiofiles
+import multiprocessing
+import orjson
+
+config = get_config()
 
 
 """Create a FastAPI instance for the MONEYME AI Q&A API."""
-app = FastAPI(title="MONEYME AI Q&A API")
+app = FastAPI(title="MONEYME AI Q&A API", default_response_class=ORJSONResponse)
 
 """Add CORS middleware to allow cross-origin requests from all origins."""
 app.add_middleware(
@@ -77,42 +95,83 @@ class ErrorResponse(BaseModel):
     detail: str
 
 
-"""Load the configuration for the QA system & Initialize the QA system with the loaded configuration."""
-config = Config()
-qa_system = QASystem(config)
-
 logger = logging.getLogger(__name__)
 
+"""Read uploads in 1 MiB chunks."""
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+"""Let clients reuse the document list briefly; it only changes after an ingest."""
+DOCUMENTS_CACHE_CONTROL = "private, max-age=5"
+
+"""Track background ingest tasks started by /upload_pdf, keyed by task ID."""
+upload_tasks: Dict[str, dict] = {}
+background_tasks = set()
+
+
+@lru_cache(maxsize=1)
+def get_ingest_executor() -> ProcessPoolExecutor:
+    """Create the process pool for PDF ingest on first use."""
+    # Spawn rather than fork: the parent already holds an initialized torch runtime
+    return ProcessPoolExecutor(
+        max_workers=config.INGEST_MAX_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+
+
+async def track_upload(task_id: str, future: asyncio.Future):
+    """Wait for a background ingest to finish, then reload the vector store it wrote."""
+    qa_system = get_qa_system()
+    try:
+        await future
+        await qa_system.refresh_vector_store()
+        upload_tasks[task_id]["status"] = "completed"
+        logger.info("Background ingest completed: %s", upload_tasks[task_id]["filename"])
+    except Exception as e:
+        upload_tasks[task_id]["status"] = "failed"
+        upload_tasks[task_id]["error"] = str(e)
+        logger.error("Background ingest failed: %s", e)
+
 
 @app.on_event("startup")
 async def startup_event():
+    qa_system = get_qa_system()
+    ensure_dirs()
     try:
         vector_store_path = config.VECTOR_STORE_PATH
-        logger.info(f"Checking for vector store at path: {vector_store_path}")
+        logger.info("Checking for vector store at path: %s", vector_store_path)
 
         if await qa_system.vector_store_service.vector_store_exists(vector_store_path):
-            await qa_system.vector_store_service.load_vector_store(vector_store_path)
+            await qa_system.refresh_vector_store()
             last_pdf = await qa_system.get_last_pdf()
-            logger.info(f"Vector store loaded. Last processed PDF: {last_pdf}")
+            logger.info("Vector store loaded. Last processed PDF: %s", last_pdf)
             print(f"Vector store loaded. Last processed PDF: {last_pdf}")
         else:
-            logger.info(f"No vector store found at {vector_store_path}")
+            logger.info("No vector store found at %s", vector_store_path)
             print(
                 "No previous vector store found. The system is ready for a new PDF upload."
             )
     except Exception as e:
-        logger.error(f"Error during startup: {str(e)}")
+        logger.error("Error during startup: %s", e)
         print(f"Error during startup: {str(e)}")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    if get_ingest_executor.cache_info().currsize:
+        get_ingest_executor().shutdown(wait=False, cancel_futures=True)
+    if get_qa_system.cache_info().currsize:
+        await get_qa_system().document_service.close()
+
+
 @app.post(
     "/query",
     response_model=QueryResponse,
     responses={400: {"model": ErrorResponse}, 500: {"model": ErrorResponse}},
 )
 async def query(request: QueryRequest):
+    qa_system = get_qa_system()
     try:
-        if not await qa_system.vector_store_service.is_loaded():
+        if not qa_system.loaded:
             raise HTTPException(
                 status_code=400,
                 detail="No PDF has been processed yet. Please upload a PDF first.",
@@ -127,11 +186,11 @@ async def query(request: QueryRequest):
     except HTTPException:
         raise
     except QASystemError as e:
-        logger.error(f"QASystemError in query: {str(e)}")
+        logger.error("QASystemError in query: %s", e)
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.exception("Unexpected error in query", exc_info=True)
-        logger.error(f"Error details: {str(e)}")
+        logger.error("Error details: %s", e)
         raise HTTPException(status_code=500, detail="An internal server error occurred")
 
 
@@ -141,8 +200,9 @@ async def query(request: QueryRequest):
     responses={400: {"model": ErrorResponse}, 500: {"model": ErrorResponse}},
 )
 async def chat(request: ChatRequest):
+    qa_system = get_qa_system()
     try:
-        if not await qa_system.vector_store_service.is_loaded():
+        if not qa_system.loaded:
             raise HTTPException(
                 status_code=400,
                 detail="No PDF has been processed yet. Please upload a PDF first.",
@@ -161,19 +221,58 @@ async def chat(request: ChatRequest):
     except HTTPException:
         raise
     except QASystemError as e:
-        logger.error(f"QASystemError in chat: {str(e)}")
+        logger.error("QASystemError in chat: %s", e)
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.exception("Unexpected error in chat", exc_info=True)
-        logger.error(f"Error details: {str(e)}")
+        logger.error("Error details: %s", e)
         raise HTTPException(status_code=500, detail="An internal server error occurred")
 
 
+@app.post(
+    "/chat/stream",
+    responses={400: {"model": ErrorResponse}, 500: {"model": ErrorResponse}},
+)
+async def chat_stream(request: ChatRequest):
+    """Stream a chat answer as newline-delimited JSON events.
+
+    The first event carries the session ID, then one {"token": ...} event per generated
+    chunk, then the same final result returned by /chat.
+    """
+    qa_system = get_qa_system()
+    if not qa_system.loaded:
+        raise HTTPException(
+            status_code=400,
+            detail="No PDF has been processed yet. Please upload a PDF first.",
+        )
+
+    events = qa_system.process_chat_query_stream(request.session_id, request.question)
+    try:
+        # Pull the session event before responding, so a bad request still gets a 400
+        first = await events.__anext__()
+    except QASystemError as e:
+        logger.error("QASystemError in chat_stream: %s", e)
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def body():
+        yield orjson.dumps(first) + b"\n"
+        try:
+            async for event in events:
+                yield orjson.dumps(event) + b"\n"
+        except QASystemError as e:
+            # Headers are already sent, so report the failure in-band
+            logger.error("QASystemError in chat_stream: %s", e)
+            yield orjson.dumps({"error": str(e)}) + b"\n"
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+
 @app.post(
     "/upload_pdf",
     responses={
         200: {"model": dict},
         400: {"model": ErrorResponse},
+        413: {"model": ErrorResponse},
         500: {"model": ErrorResponse},
     },
 )
@@ -182,40 +281,100 @@ async def upload_pdf(file: UploadFile = File(...)):
         if not file.filename.lower().endswith(".pdf"):
             raise HTTPException(status_code=400, detail="Uploaded file must be a PDF")
 
-        os.makedirs(config.UPLOAD_DIRECTORY, exist_ok=True)
         file_path = os.path.join(config.UPLOAD_DIRECTORY, file.filename)
 
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
+        # Stream the upload to disk so memory use stays flat regardless of PDF size
+        max_bytes = config.MAX_UPLOAD_MB * 1024 * 1024
+        total_bytes = 0
+        async with aiofiles.open(file_path, "wb") as buffer:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                total_bytes += len(chunk)
+                if total_bytes > max_bytes:
+                    break
+                await buffer.write(chunk)
+
+        if total_bytes > max_bytes:
+            os.remove(file_path)
+            raise HTTPException(
+                status_code=413,
+                detail=f"Uploaded file exceeds the {config.MAX_UPLOAD_MB} MB limit",
+            )
 
-        task = asyncio.create_task(
-            qa_system.load_or_create_vector_store(file_path, file.filename)
+        # Parsing and embedding are CPU-bound, so run them outside the event loop's process
+        task_id = str(uuid.uuid4())
+        upload_tasks[task_id] = {"status": "processing", "filename": file.filename}
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(
+            get_ingest_executor(), ingest_pdf, file_path, file.filename
         )
+        tracker = asyncio.create_task(track_upload(task_id, future))
+        background_tasks.add(tracker)
+        tracker.add_done_callback(background_tasks.discard)
 
         return {
-            "message": f"PDF upload started. Processing in background: {file.filename}"
+            "message": f"PDF upload started. Processing in background: {file.filename}",
+            "task_id": task_id,
         }
 
+    except HTTPException:
+        raise
     except QASystemError as e:
-        logger.error(f"QASystemError in upload_pdf: {str(e)}")
+        logger.error("QASystemError in upload_pdf: %s", e)
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.exception("Error processing PDF", exc_info=True)
-        logger.error(f"Error details: {str(e)}")
+        logger.error("Error details: %s", e)
         raise HTTPException(status_code=500, detail="Error processing PDF")
 
 
+@app.get(
+    "/upload_status/{task_id}",
+    responses={200: {"model": dict}, 404: {"model": ErrorResponse}},
+)
+async def upload_status(task_id: str):
+    task = upload_tasks.get(task_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail="Upload task not found")
+    return {"task_id": task_id, **task}
+
+
+def documents_etag(tracker_db_path: str) -> Optional[str]:
+    """Build an ETag from the files that change when a document is ingested."""
+    paths = (
+        os.path.join(config.VECTOR_STORE_PATH, "index.faiss"),
+        tracker_db_path,
+        f"{tracker_db_path}-wal",
+    )
+    parts = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            continue
+        parts.append(f"{st.st_mtime_ns:x}-{st.st_size:x}")
+    if not parts:
+        return None
+    return f'W/"{".".join(parts)}"'
+
+
 @app.get(
     "/list_documents", responses={200: {"model": dict}, 500: {"model": ErrorResponse}}
 )
-async def list_documents():
+async def list_documents(request: Request):
+    qa_system = get_qa_system()
     try:
+        etag = documents_etag(qa_system.document_service.document_tracker.db_path)
+        if etag is not None and request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+
         documents = await qa_system.list_documents()
-        return {"documents": documents}
+        headers = {"Cache-Control": DOCUMENTS_CACHE_CONTROL}
+        if etag is not None:
+            headers["ETag"] = etag
+        return ORJSONResponse({"documents": documents}, headers=headers)
     except Exception as e:
         logger.exception("Error listing documents", exc_info=True)
-        logger.error(f"Error details: {str(e)}")
+        logger.error("Error details: %s", e)
         raise HTTPException(status_code=500, detail="Error listing documents")
 
 
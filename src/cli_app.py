@@ -1,11 +1,10 @@
 import argparse
 import sys
 import os
-import uuid
 import shutil
 import asyncio
-from src.config import Config
-from src.core.qa_system import QASystem
+from src.config import ensure_dirs, get_config
+from src.core.qa_system import get_qa_system
 from src.utils.error_handler import QASystemError
 import logging 
 
@@ -48,7 +47,7 @@ async def handle_query_mode(qa_system, args):
         sys.exit(1)
 
     try:
-        if not await qa_system.vector_store_service.is_loaded():
+        if not qa_system.loaded:
             print("Error: No vector store has been processed yet. Please upload a PDF first.")
             sys.exit(1)
         result = await qa_system.process_single_query(args.question)
@@ -61,10 +60,11 @@ async def handle_query_mode(qa_system, args):
 
 async def handle_chat_mode(qa_system):
     try:
-        if not await qa_system.vector_store_service.is_loaded():
+        if not qa_system.loaded:
             print("Error: No vector store has been processed yet. Please upload a PDF first.")
             sys.exit(1)
-        session_id = str(uuid.uuid4())
+        # Assigned by the first answer, then reused for the rest of the conversation
+        session_id = None
         print("Chat mode. Type 'exit' to end the conversation.")
         while True:
             question = input("You: ")
@@ -72,6 +72,7 @@ async def handle_chat_mode(qa_system):
                 break
             try:
                 result = await qa_system.process_chat_query(session_id, question)
+                session_id = result["session_id"]
                 print(f"AI: {result['answer']}")
             except QASystemError as e:
                 print(f"Error: {str(e)}")
@@ -92,16 +93,14 @@ async def handle_list_mode(qa_system):
 
 async def async_main():
     """Main function for handling CLI input and managing QA system operations."""
-    config = Config()
-    qa_system = QASystem(config)
-
-    os.makedirs(config.UPLOAD_DIRECTORY, exist_ok=True)
-    os.makedirs(config.VECTOR_STORE_PATH, exist_ok=True)
+    qa_system = get_qa_system()
+    config = get_config()
+    ensure_dirs()
 
     # Check if the vector store exists
     try:
         if await qa_system.vector_store_service.vector_store_exists(config.VECTOR_STORE_PATH):
-            await qa_system.vector_store_service.load_vector_store(config.VECTOR_STORE_PATH)
+            await qa_system.refresh_vector_store()
             print(f"Loaded existing vector store from: {config.VECTOR_STORE_PATH}")
         else:
             print("No existing vector store found. Please upload a PDF to create a vector store.")
@@ -119,14 +118,17 @@ async def async_main():
     parser.add_argument("--question", help="Question to ask (for query mode)")
     args = parser.parse_args()
 
-    if args.mode == "upload":
-        await handle_upload_mode(qa_system, args, config)
-    elif args.mode == "query":
-        await handle_query_mode(qa_system, args)
-    elif args.mode == "chat":
-        await handle_chat_mode(qa_system)
-    elif args.mode == "list":
-        await handle_list_mode(qa_system)
+    try:
+        if args.mode == "upload":
+            await handle_upload_mode(qa_system, args, config)
+        elif args.mode == "query":
+            await handle_query_mode(qa_system, args)
+        elif args.mode == "chat":
+            await handle_chat_mode(qa_system)
+        elif args.mode == "list":
+            await handle_list_mode(qa_system)
+    finally:
+        await qa_system.document_service.close()
 
 def main():
     """Wrapper for running the async main."""
@@ -1,49 +1,123 @@
 import os
+from dataclasses import dataclass, fields
+from functools import lru_cache
+from typing import Tuple
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
 
+@dataclass(frozen=True, slots=True)
 class Config:
-    """Configuration class for the QA system."""
+    """Configuration class for the QA system, parsed once from the environment."""
 
     # General LLM provider configuration
-    LLM_PROVIDER = os.getenv("LLM_PROVIDER", "ollama")
+    LLM_PROVIDER: str = "ollama"
 
     # OpenAI configuration
-    OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
-    OPENAI_API_BASE = os.getenv("OPENAI_API_BASE", "https://api.openai.com/v1")
-    OPENAI_MODEL_NAME = os.getenv("OPENAI_MODEL_NAME", "gpt-3.5-turbo")
+    OPENAI_API_KEY: str = ""
+    OPENAI_API_BASE: str = "https://api.openai.com/v1"
+    OPENAI_MODEL_NAME: str = "gpt-3.5-turbo"
 
     # Ollama configuration
-    OLLAMA_API_KEY = os.getenv("OLLAMA_API_KEY", "")
-    OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
-    OLLAMA_MODEL_NAME = os.getenv("OLLAMA_MODEL_NAME", "mistral")
+    OLLAMA_API_KEY: str = ""
+    OLLAMA_BASE_URL: str = "http://localhost:11434"
+    OLLAMA_MODEL_NAME: str = "mistral"
 
-    # Embedding model configuration
-    EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers")
-    EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "paraphrase-MiniLM-L6-v2")
+    # Embedding model configuration ("sentence-transformers" or "onnx-int8")
+    EMBEDDING_MODEL: str = "sentence-transformers"
+    EMBEDDING_MODEL_NAME: str = "paraphrase-MiniLM-L6-v2"
+    EMBEDDING_BATCH_SIZE: int = 64
+    # torch intra-op threads used for embedding; 0 splits the cores between parallel batches
+    EMBEDDING_NUM_THREADS: int = 0
+    # Directory of the exported ONNX model, used by the "onnx-int8" backend
+    EMBEDDING_ONNX_PATH: str = "./models/paraphrase-MiniLM-L6-v2-onnx-int8"
+
+    # Run embeddings and FAISS search on CUDA when a GPU is available
+    USE_GPU: bool = True
 
     # Vector store configuration
-    VECTOR_STORE_PATH = os.getenv("VECTOR_STORE_PATH", "./vector_store/faiss_index")
-    UPLOAD_DIRECTORY = os.getenv("UPLOAD_DIRECTORY", "./uploads")
+    VECTOR_STORE_PATH: str = "./vector_store/faiss_index"
+    UPLOAD_DIRECTORY: str = "./uploads"
+    MAX_UPLOAD_MB: int = 100
+
+    # FAISS index configuration ("hnsw", "flat", "ivf_flat" or "ivf_sq8")
+    FAISS_INDEX_TYPE: str = "hnsw"
+    # Stored vector precision ("float32" or "int8"); int8 scalar-quantizes every index type
+    EMBEDDING_PRECISION: str = "float32"
+    FAISS_HNSW_M: int = 32
+    FAISS_HNSW_EF_CONSTRUCTION: int = 200
+    FAISS_HNSW_EF_SEARCH: int = 64
+    FAISS_IVF_NLIST: int = 64
+    FAISS_IVF_NPROBE: int = 8
+    # Memory-map the inverted lists of loaded IVF indexes read-only, sharing them between
+    # processes; flat and HNSW indexes are always loaded as a private copy
+    FAISS_MMAP: bool = True
+    # OpenMP threads used by FAISS searches; 0 picks half the cores, at most 4
+    FAISS_NUM_THREADS: int = 0
+
+    # Micro-batching of concurrent /query retrievals
+    QUERY_BATCH_MAX_SIZE: int = 16
+    QUERY_BATCH_WAIT_MS: float = 10
+
+    # Background ingest configuration; jobs take turns writing the store, so extra workers
+    # only wait on each other
+    INGEST_MAX_WORKERS: int = 1
+
+    # New configuration options ("|"-separated in the environment)
+    CHAIN_OF_THOUGHTS_ENABLED: bool = False
+    CHAIN_OF_THOUGHTS_PROMPT: Tuple[str, ...] = ()
+    EXAMPLE_PROMPTS: Tuple[str, ...] = ()
+
+    # Model context window in tokens, 0 to use the configured model's own; chat history may
+    # use CONVERSATION_TOKEN_RATIO of it before older messages are compressed into factoids
+    CONTEXT_WINDOW: int = 0
+    CONVERSATION_TOKEN_RATIO: float = 0.2
+
+    # Chat sessions older than this many seconds are pruned
+    CONVERSATION_MAX_AGE_SECONDS: int = 86400
+
+    # Semantic cache configuration
+    SEMANTIC_CACHE_ENABLED: bool = True
+    SEMANTIC_CACHE_THRESHOLD: float = 0.95
+    SEMANTIC_CACHE_MAX_SIZE: int = 256
+
+    @classmethod
+    def _from_env(cls) -> "Config":
+        """Build a Config from environment variables, falling back to the field defaults."""
+        values = {}
+        for field in fields(cls):
+            raw = os.getenv(field.name)
+            if raw is None:
+                continue
+            if field.type is bool:
+                values[field.name] = raw.lower() == "true"
+            elif field.type in (int, float):
+                values[field.name] = field.type(raw)
+            elif field.type == Tuple[str, ...]:
+                values[field.name] = tuple(raw.split("|")) if raw else ()
+            else:
+                values[field.name] = raw
+        return cls(**values)
+
+
+@lru_cache(maxsize=1)
+def get_config() -> Config:
+    """Return the process-wide Config, reading the environment only on the first call."""
+    return Config._from_env()
+
+
+# Create the global configuration instance, parsed once per process
+config = get_config()
 
-    # New configuration options
-    CHAIN_OF_THOUGHTS_ENABLED = (
-        os.getenv("CHAIN_OF_THOUGHTS_ENABLED", "False").lower() == "true"
-    )
-    CHAIN_OF_THOUGHTS_PROMPT = os.getenv("CHAIN_OF_THOUGHTS_PROMPT", "").split("|")
-    EXAMPLE_PROMPTS = (
-        os.getenv("EXAMPLE_PROMPTS", "").split("|")
-        if os.getenv("EXAMPLE_PROMPTS")
-        else []
-    )
 
+@lru_cache(maxsize=1)
+def ensure_dirs():
+    """Create the vector store and upload directories once per process."""
+    os.makedirs(config.VECTOR_STORE_PATH, exist_ok=True)
+    os.makedirs(config.UPLOAD_DIRECTORY, exist_ok=True)
 
-# Create a global instance of the Config class
-config = Config()
 
 # Create necessary directories
-os.makedirs(config.VECTOR_STORE_PATH, exist_ok=True)
-os.makedirs(config.UPLOAD_DIRECTORY, exist_ok=True)
+ensure_dirs()
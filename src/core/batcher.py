@@ -0,0 +1,77 @@
+# src/core/batcher.py
+
+from typing import Any, Callable, List, Optional
+import asyncio
+
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+
+class MicroBatcher:
+    """Coalesces concurrent submissions into batched calls of a synchronous function."""
+
+    def __init__(
+        self,
+        batch_fn: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = 16,
+        max_wait_ms: float = 10,
+    ):
+        """
+        Initialize the MicroBatcher.
+
+        Args:
+            batch_fn (Callable): Synchronous function mapping a list of items to a list of
+                                 results in the same order. It runs in a worker thread.
+            max_batch_size (int): Maximum number of items dispatched in one call.
+            max_wait_ms (float): How long the first item of a batch waits for company.
+        """
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    async def submit(self, item: Any) -> Any:
+        """Queue an item and wait for its result from the next batch."""
+        if self._worker is None:
+            # Created lazily so the queue and task bind to the running event loop
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _collect(self) -> list:
+        """Wait for one item, then gather more until the batch is full or the window closes."""
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            items = [item for item, _ in batch]
+            try:
+                results = await asyncio.to_thread(self.batch_fn, items)
+            except Exception as e:
+                logger.error("Batched call failed", batch_size=len(batch), error=str(e))
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            logger.debug("Batched call completed", batch_size=len(batch))
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
@@ -1,47 +1,179 @@
-from typing import List, Dict
+from typing import Iterable, List, Dict, Optional, Tuple
 from collections import deque
+import heapq
+import itertools
+import re
 import time
 import asyncio
 
+# Rough characters-per-token ratio for English text, enough to keep history within budget
+CHARS_PER_TOKEN = 4
+# Compressed messages keep at most this many factoids per session
+MAX_FACTOIDS = 32
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+# Sentences worth keeping from an old message: figures, multi-word names and decisions
+_FACTOID = re.compile(
+    r"\d"
+    r"|\b[A-Z][a-z]+(?:\s+[A-Z][a-z]+)+\b"
+    r"|\b(?:decid|agree|chose|choos|prefer|plan|want|need)"
+)
+_WORD = re.compile(r"\w+")
+
 
 class ConversationManager:
     """Manage conversations for different sessions, handling message history and pruning old conversations."""
 
-    def __init__(self, max_history: int = 10):
-        """Initialize the conversation manager with a maximum history length for each session."""
+    def __init__(
+        self,
+        max_history: int = 10,
+        track_time: bool = True,
+        token_budget: Optional[int] = None,
+        keep_recent: int = 4,
+    ):
+        """Initialize the conversation manager with a maximum history length for each session.
+
+        With `track_time` off no clock is read at all and `prune_old_conversations` is a no-op,
+        which suits ephemeral sessions that are never pruned.
+
+        With a `token_budget`, the summary keeps the last `keep_recent` messages verbatim and
+        compresses older ones into extracted factoids once the verbatim part exceeds the budget
+        (or the history is full), instead of dropping them.
+        """
         self.max_history = max_history
+        self._track_time = track_time
+        self.token_budget = token_budget
+        self.keep_recent = keep_recent
+        self._char_budget = (
+            token_budget * CHARS_PER_TOKEN if token_budget is not None else None
+        )
         self.conversations: Dict[str, deque] = {}
+        # Pre-formatted summary lines, kept in lockstep with each session's message deque
+        # unless compression is on, plus their running character count
+        self._summary_lines: Dict[str, deque] = {}
+        self._summary_chars: Dict[str, int] = {}
+        # Factoids extracted from messages compressed out of the summary lines
+        self._factoids: Dict[str, deque] = {}
+        # Session start times, plus a min-heap of (start, seq, session_id) so pruning only
+        # touches expired sessions; entries for cleared sessions are skipped lazily. The
+        # sequence number breaks timestamp ties without comparing session IDs.
+        self._session_started: Dict[str, float] = {}
+        self._started_heap: List[Tuple[float, int, str]] = []
+        self._heap_seq = itertools.count()
 
     def add_message(self, session_id: str, role: str, content: str):
         """Add a message to the conversation history for a specific session."""
+        self.add_messages(session_id, ((role, content),))
+
+    def add_messages(self, session_id: str, messages: Iterable[Tuple[str, str]]):
+        """Add several (role, content) messages to a session's history in one call."""
         if session_id not in self.conversations:
             self.conversations[session_id] = deque(maxlen=self.max_history)
+            self._summary_lines[session_id] = deque(maxlen=self.max_history)
+            self._summary_chars[session_id] = 0
+            if self._track_time:
+                # Only the session start is timestamped, on the monotonic clock so wall-clock
+                # adjustments never expire or revive sessions
+                timestamp = time.monotonic()
+                self._session_started[session_id] = timestamp
+                heapq.heappush(
+                    self._started_heap, (timestamp, next(self._heap_seq), session_id)
+                )
 
-        self.conversations[session_id].append(
-            {"role": role, "content": content, "timestamp": time.time()}
-        )
+        conversation = self.conversations[session_id]
+        summary_lines = self._summary_lines[session_id]
+        for role, content in messages:
+            # Stored in the role/content shape the API and providers consume, so reading
+            # the history never rebuilds per-message objects
+            conversation.append({"role": role, "content": content})
+            speaker = "Human" if role == "user" else "AI"
+            line = f"{speaker}: {content}"
+            if self._char_budget is not None and len(summary_lines) == self.max_history:
+                # About to be evicted by the deque; keep what matters from it
+                self._compress(session_id, summary_lines.popleft())
+            elif len(summary_lines) == self.max_history:
+                self._summary_chars[session_id] -= len(summary_lines[0]) + 1
+            summary_lines.append(line)
+            self._summary_chars[session_id] += len(line) + 1
+
+        if self._char_budget is not None:
+            while (
+                self._summary_chars[session_id] > self._char_budget
+                and len(summary_lines) > self.keep_recent
+            ):
+                self._compress(session_id, summary_lines.popleft())
+
+    def _compress(self, session_id: str, line: str):
+        """Fold a summary line evicted from the verbatim window into the session's factoids."""
+        self._summary_chars[session_id] -= len(line) + 1
+        speaker, _, content = line.partition(": ")
+        factoids = self._factoids.get(session_id)
+        if factoids is None:
+            factoids = self._factoids[session_id] = deque(maxlen=MAX_FACTOIDS)
+        for sentence in _SENTENCE_END.split(content):
+            if _FACTOID.search(sentence):
+                factoids.append(f"{speaker}: {sentence.strip()}")
 
     def get_conversation(self, session_id: str) -> List[Dict]:
         """Retrieve the full conversation history for a specific session."""
-        return list(self.conversations.get(session_id, []))
+        return self.get_conversation_history(session_id)
 
     def clear_conversation(self, session_id: str):
         """Clear the conversation history for a specific session."""
         if session_id in self.conversations:
             del self.conversations[session_id]
+            del self._summary_lines[session_id]
+            del self._summary_chars[session_id]
+            self._factoids.pop(session_id, None)
+            self._session_started.pop(session_id, None)
+
+    def prune_old_conversations(self, max_age: float):
+        """Remove sessions that started more than `max_age` seconds ago."""
+        now = time.monotonic()
+        heap = self._started_heap
+        while heap and now - heap[0][0] > max_age:
+            started, _, session_id = heapq.heappop(heap)
+            # Skip heap entries left behind by sessions that were cleared or restarted
+            if self._session_started.get(session_id) == started:
+                self.clear_conversation(session_id)
 
     def get_conversation_history(self, session_id: str) -> List[Dict]:
         """Get the conversation history for a session, returning only role and content."""
-        conversation = self.get_conversation(session_id)
-        return [
-            {"role": msg["role"], "content": msg["content"]} for msg in conversation
-        ]
-
-    def get_conversation_summary(self, session_id: str) -> str:
-        """Generate a summary of the conversation for a specific session."""
-        conversation = self.get_conversation(session_id)
-        summary = []
-        for message in conversation:
-            role = "Human" if message["role"] == "user" else "AI"
-            summary.append(f"{role}: {message['content']}")
-        return "\n".join(summary)
+        # Copies, so a caller editing an entry cannot rewrite stored history or its token count
+        return [dict(message) for message in self.conversations.get(session_id, ())]
+
+    def get_conversation_summary(
+        self, session_id: str, query: Optional[str] = None
+    ) -> str:
+        """
+        Generate a summary of the conversation for a specific session.
+
+        Recent messages are returned verbatim. Factoids from compressed older messages are
+        prepended as far as the token budget allows, preferring those that share words with
+        `query` when one is given, and otherwise the most recent.
+        """
+        recent = "\n".join(self._summary_lines.get(session_id, ()))
+        factoids = self._factoids.get(session_id)
+        if not factoids:
+            return recent
+
+        candidates = list(enumerate(factoids))
+        if query:
+            query_words = frozenset(_WORD.findall(query.lower()))
+            candidates.sort(
+                key=lambda c: len(query_words.intersection(_WORD.findall(c[1].lower())))
+            )
+        remaining = self._char_budget - self._summary_chars[session_id]
+        selected = []
+        # Candidates are ordered worst-first, so take from the end
+        for position, factoid in reversed(candidates):
+            if len(factoid) + 1 > remaining:
+                continue
+            selected.append((position, factoid))
+            remaining -= len(factoid) + 1
+        if not selected:
+            return recent
+
+        selected.sort()
+        earlier = "\n".join(factoid for _, factoid in selected)
+        return f"Earlier in the conversation:\n{earlier}\n\nRecent messages:\n{recent}"
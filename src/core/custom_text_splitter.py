@@ -1,7 +1,8 @@
 # src/core/custom_text_splitter.py
 
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from typing import List, Dict, Any
+from types import MappingProxyType
+from typing import Iterator, Dict, Any
 
 
 class MetadataTextSplitter(RecursiveCharacterTextSplitter):
@@ -19,20 +20,21 @@ class MetadataTextSplitter(RecursiveCharacterTextSplitter):
 
     def split_text_with_metadata(
         self, text: str, metadata: Dict[str, Any]
-    ) -> List[Dict[str, Any]]:
+    ) -> Iterator[Dict[str, Any]]:
         """
         Split text into chunks and associate each chunk with metadata.
 
+        Chunks are yielded lazily and share a single read-only view of the metadata
+        instead of carrying a copy each.
+
         Args:
             text (str): The input text to split.
             metadata (Dict[str, Any]): Metadata to associate with each chunk of text.
 
         Returns:
-            List[Dict[str, Any]]: A list of dictionaries where each dictionary contains
-                                  a chunk of text and its associated metadata.
+            Iterator[Dict[str, Any]]: Dictionaries each containing a chunk of text and a
+                                      read-only mapping of its associated metadata.
         """
-        chunks = []
-        split_texts = self.split_text(text)
-        for chunk in split_texts:
-            chunks.append({"content": chunk, "metadata": metadata.copy()})
-        return chunks
+        metadata_ro = MappingProxyType(metadata)
+        for chunk in self.split_text(text):
+            yield {"content": chunk, "metadata": metadata_ro}
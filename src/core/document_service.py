@@ -9,22 +9,40 @@ import structlog
 from src.utils.logging_configs import configure_logging
 from src.utils.error_handler import DocumentProcessingError
 import asyncio
-import aiofiles
 
 configure_logging()
 logger = structlog.get_logger(__name__)
 
 
+def _read_text(path: str) -> str:
+    with open(path, "r") as f:
+        return f.read()
+
+
+def _write_text(path: str, text: str):
+    with open(path, "w") as f:
+        f.write(text)
+
+
 class DocumentService:
     """Service for managing document processing, tracking, and retrieval."""
 
     def __init__(self, config: Config):
         self.config = config
         self.document_tracker = DocumentTracker()
-        # Call async init method explicitly
-        asyncio.create_task(self.document_tracker.initialize())
+        # The tracker's table is created on first use, inside the running event loop
+        self._init_event = asyncio.Event()
+        self._init_lock = asyncio.Lock()
         self.last_pdf_file = os.path.join(os.path.expanduser("~"), "last_pdf.txt")
 
+    async def _ensure_initialized(self):
+        """Initialize the document tracker once, before its first query."""
+        if not self._init_event.is_set():
+            async with self._init_lock:
+                if not self._init_event.is_set():
+                    await self.document_tracker.initialize()
+                    self._init_event.set()
+
     async def process_document(
         self, pdf_path: str, original_filename: str
     ) -> List[dict]:
@@ -71,6 +89,7 @@ class DocumentService:
             List[str]: A list of all processed document names.
         """
         try:
+            await self._ensure_initialized()
             return await self.document_tracker.get_all_documents()
         except Exception as e:
             logger.exception("Error retrieving document list")
@@ -85,9 +104,9 @@ class DocumentService:
             str: The path of the last processed PDF, or None if no PDF has been processed.
         """
         if os.path.exists(self.last_pdf_file):
-            async with aiofiles.open(self.last_pdf_file, "r") as f:
-                content = await f.read()  # Await the read operation first
-                return content.strip()  # Now call strip on the result
+            # One thread hop for open + read, rather than one per aiofiles operation
+            content = await asyncio.to_thread(_read_text, self.last_pdf_file)
+            return content.strip()
         return None
 
     async def _save_last_pdf(self, pdf_path: str):
@@ -97,8 +116,7 @@ class DocumentService:
         Args:
             pdf_path (str): The path of the PDF to save.
         """
-        async with aiofiles.open(self.last_pdf_file, "w") as f:
-            await f.write(pdf_path)
+        await asyncio.to_thread(_write_text, self.last_pdf_file, pdf_path)
 
     async def is_document_processed(self, pdf_path: str) -> bool:
         """
@@ -110,6 +128,7 @@ class DocumentService:
         Returns:
             bool: True if the document has been processed, False otherwise.
         """
+        await self._ensure_initialized()
         return await self.document_tracker.is_document_processed(pdf_path)
 
     async def add_document(self, pdf_path: str, original_filename: str):
@@ -120,6 +139,11 @@ class DocumentService:
             pdf_path (str): The path of the processed PDF.
             original_filename (str): The original filename of the PDF.
         """
+        await self._ensure_initialized()
         await self.document_tracker.add_document(pdf_path, original_filename)
         await self._save_last_pdf(pdf_path)
         logger.info("Document added to tracker", filename=original_filename)
+
+    async def close(self):
+        """Close the document tracker's database connection."""
+        await self.document_tracker.close()
@@ -1,8 +1,59 @@
-import sqlite3
 import hashlib
 import asyncio
+import os
+from functools import lru_cache
+from operator import itemgetter
 import aiosqlite
-import aiofiles
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+# Files are hashed in 1 MiB blocks so memory stays flat regardless of PDF size
+HASH_CHUNK_SIZE = 1 << 20
+
+# The digest stored for every document; always available, so the stored values never
+# depend on which optional packages are installed
+HASH_ALGORITHM = "sha256"
+# The digest of rows recorded before the stat columns existed, whose file_size is NULL
+LEGACY_HASH_ALGORITHM = "md5"
+
+
+def _hash_file_sync(file_path, algorithm=HASH_ALGORITHM):
+    """Hashes a file by streaming it in fixed-size blocks."""
+    h = hashlib.new(algorithm)
+    with open(file_path, "rb") as file:
+        while chunk := file.read(HASH_CHUNK_SIZE):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+@lru_cache(maxsize=512)
+def _hash_file_cached(file_path, mtime_ns, size):
+    """Hashes a file once per (path, mtime, size); a modified file gets a new entry."""
+    return _hash_file_sync(file_path)
+
+
+def _file_key(file_path):
+    """Returns the (path, mtime, size) key identifying a file's current contents."""
+    st = os.stat(file_path)
+    return (file_path, st.st_mtime_ns, st.st_size)
+
+
+def _keyed_file_hash(file_path):
+    """Returns a file's (path, mtime, size) key together with its cached content hash."""
+    file_key = _file_key(file_path)
+    return file_key, _hash_file_cached(*file_key)
+
+
+def _rehash_legacy(file_path, legacy_hash):
+    """Returns the key and current hash of a file recorded under MD5, if it is unchanged."""
+    try:
+        file_key = _file_key(file_path)
+    except OSError:
+        return None
+    if _hash_file_sync(file_path, LEGACY_HASH_ALGORITHM) != legacy_hash:
+        return None
+    return file_key, _hash_file_cached(*file_key)
 
 
 class DocumentTracker:
@@ -11,15 +62,37 @@ class DocumentTracker:
     def __init__(self, db_path="processed_documents.db"):
         """Initializes the DocumentTracker with a database connection."""
         self.db_path = db_path
+        # One long-lived connection, opened on first use
+        self.conn = None
+        self._connect_lock = asyncio.Lock()
+        # Reads share the connection freely; writes are serialized so commits don't interleave
+        self._write_lock = asyncio.Lock()
+        # File keys already known to be in the database; only positive results are kept,
+        # since a document can be added after a negative check but is never removed
+        self._processed_keys = set()
+        # Whether MD5 rows whose file could not be rehashed remain, set by create_table
+        self._has_legacy_hashes = False
         # Do not call async methods here
 
     async def initialize(self):
         """Initializes the DocumentTracker asynchronously."""
         await self.create_table()
 
+    async def _get_connection(self):
+        """Returns the shared database connection, opening it on first use."""
+        if self.conn is None:
+            async with self._connect_lock:
+                if self.conn is None:
+                    conn = await aiosqlite.connect(self.db_path)
+                    await conn.execute("PRAGMA journal_mode=WAL")
+                    await conn.execute("PRAGMA synchronous=NORMAL")
+                    self.conn = conn
+        return self.conn
+
     async def create_table(self):
         """Creates the documents table if it doesn't exist."""
-        async with aiosqlite.connect(self.db_path) as db:
+        db = await self._get_connection()
+        async with self._write_lock:
             await db.execute(
                 """
                 CREATE TABLE IF NOT EXISTS documents (
@@ -27,62 +100,119 @@ class DocumentTracker:
                     file_hash TEXT UNIQUE,
                     file_path TEXT,
                     file_name TEXT,
-                    processed_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    processed_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    file_size INTEGER,
+                    mtime INTEGER
                 )
                 """
             )
+            # Databases created before the stat columns existed are migrated in place
+            table_info = await db.execute_fetchall("PRAGMA table_info(documents)")
+            columns = {row[1] for row in table_info}
+            for column in ("file_size", "mtime"):
+                if column not in columns:
+                    await db.execute(f"ALTER TABLE documents ADD COLUMN {column} INTEGER")
+            # Rows from before the migration hold MD5 digests and no stat columns; rehash
+            # those whose file is still unchanged on disk, so both lookups match them again.
+            # OR IGNORE: the same content may already have been recorded again since
+            legacy_rows = await db.execute_fetchall(
+                "SELECT id, file_hash, file_path FROM documents WHERE file_size IS NULL"
+            )
+            for row_id, legacy_hash, file_path in legacy_rows:
+                rehashed = await asyncio.to_thread(_rehash_legacy, file_path, legacy_hash)
+                if rehashed is None:
+                    continue
+                file_key, file_hash = rehashed
+                await db.execute(
+                    "UPDATE OR IGNORE documents SET file_hash = ?, file_size = ?, mtime = ? "
+                    "WHERE id = ?",
+                    (file_hash, file_key[2], file_key[1], row_id),
+                )
+            remaining = await db.execute_fetchall(
+                "SELECT 1 FROM documents WHERE file_size IS NULL LIMIT 1"
+            )
+            self._has_legacy_hashes = bool(remaining)
+            # file_hash is UNIQUE and so already indexed; drop the duplicate older
+            # databases were given
+            await db.execute("DROP INDEX IF EXISTS idx_file_hash")
+            await db.execute(
+                "CREATE INDEX IF NOT EXISTS idx_file_stat "
+                "ON documents(file_path, file_size, mtime)"
+            )
             await db.commit()
 
     async def get_file_hash(self, file_path):
-        """Generates an MD5 hash for the given file."""
-        async with aiofiles.open(file_path, "rb") as file:
-            content = await file.read()
-            return hashlib.md5(content).hexdigest()
+        """Generates a content hash for the given file in a worker thread."""
+        _, file_hash = await asyncio.to_thread(_keyed_file_hash, file_path)
+        return file_hash
 
     async def is_document_processed(self, file_path):
         """Checks if a document has already been processed."""
-        file_hash = await self.get_file_hash(file_path)
-        async with aiosqlite.connect(self.db_path) as db:
-            async with db.execute(
-                "SELECT * FROM documents WHERE file_hash = ?", (file_hash,)
-            ) as cursor:
-                result = await cursor.fetchone()
-                return result is not None
+        file_key = await asyncio.to_thread(_file_key, file_path)
+        if file_key in self._processed_keys:
+            return True
 
-    async def add_document(self, file_path, file_name):
-        """Adds a document's details to the database."""
-        file_hash = await self.get_file_hash(file_path)
+        # A recorded file at the same path with unchanged size and mtime needs no hashing
+        db = await self._get_connection()
+        async with db.execute(
+            "SELECT 1 FROM documents WHERE file_path = ? AND file_size = ? AND mtime = ? "
+            "LIMIT 1",
+            (file_path, file_key[2], file_key[1]),
+        ) as cursor:
+            row = await cursor.fetchone()
+        if row is not None:
+            self._processed_keys.add(file_key)
+            return True
 
-        # Check if the document already exists before trying to insert
-        async with aiosqlite.connect(self.db_path) as db:
+        file_hash = await asyncio.to_thread(_hash_file_cached, *file_key)
+        async with db.execute(
+            "SELECT 1 FROM documents WHERE file_hash = ? LIMIT 1", (file_hash,)
+        ) as cursor:
+            row = await cursor.fetchone()
+        if row is None and self._has_legacy_hashes:
+            # Rows that could not be rehashed still match a re-upload of the same content
+            legacy_hash = await asyncio.to_thread(
+                _hash_file_sync, file_path, LEGACY_HASH_ALGORITHM
+            )
             async with db.execute(
-                "SELECT 1 FROM documents WHERE file_hash = ?", (file_hash,)
+                "SELECT 1 FROM documents WHERE file_hash = ? AND file_size IS NULL LIMIT 1",
+                (legacy_hash,),
             ) as cursor:
-                result = await cursor.fetchone()
+                row = await cursor.fetchone()
+        if row is not None:
+            self._processed_keys.add(file_key)
+        return row is not None
 
-            if result:
-                # Document already exists, handle it (e.g., log or skip)
-                logger.info(f"Document already exists in the tracker: {file_name}")
-                return  # Skip the insertion to avoid the UNIQUE constraint error
+    async def add_document(self, file_path, file_name):
+        """Adds a document's details to the database."""
+        file_key, file_hash = await asyncio.to_thread(_keyed_file_hash, file_path)
 
-            # Insert the document if it doesn't exist
-            await db.execute(
-                "INSERT INTO documents (file_hash, file_path, file_name) VALUES (?, ?, ?)",
-                (file_hash, file_path, file_name),
+        # The UNIQUE file_hash constraint turns a duplicate into a no-op in the same statement
+        db = await self._get_connection()
+        async with self._write_lock:
+            cursor = await db.execute(
+                "INSERT OR IGNORE INTO documents "
+                "(file_hash, file_path, file_name, file_size, mtime) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (file_hash, file_path, file_name, file_key[2], file_key[1]),
             )
             await db.commit()
+        self._processed_keys.add(file_key)
+
+        if cursor.rowcount == 0:
+            logger.info("Document already exists in the tracker", file_name=file_name)
 
     async def get_all_documents(self):
         """Retrieves the names of all processed documents."""
-        async with aiosqlite.connect(self.db_path) as db:
-            async with db.execute("SELECT file_name FROM documents") as cursor:
-                rows = await cursor.fetchall()
-                return [row[0] for row in rows]
+        db = await self._get_connection()
+        rows = await db.execute_fetchall("SELECT file_name FROM documents")
+        return list(map(itemgetter(0), rows))
 
     async def close(self):
         """Closes the database connection."""
-        if hasattr(self, "conn") and self.conn:
-            await self.conn.close()
+        if self.conn is not None:
+            conn, self.conn = self.conn, None
+            await conn.close()
 
     async def __aenter__(self):
         """Async context manager enter method."""
@@ -0,0 +1,144 @@
+# src/core/embedding_cache.py
+
+from collections import OrderedDict
+from typing import List
+import hashlib
+import os
+import threading
+
+import numpy as np
+import structlog
+from langchain_core.embeddings import Embeddings
+
+logger = structlog.get_logger(__name__)
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that memoizes vectors in memory and persists them to disk by content hash."""
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        model_name: str,
+        cache_dir: str,
+        maxsize: int = 4096,
+    ):
+        """
+        Initialize the CachedEmbeddings wrapper.
+
+        Args:
+            embeddings (Embeddings): The underlying embedding model.
+            model_name (str): The model name, mixed into every cache key.
+            cache_dir (str): Directory holding one `.npy` file per cached vector.
+            maxsize (int): Maximum number of vectors kept in the in-memory layer.
+        """
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.cache_dir = cache_dir
+        self.maxsize = maxsize
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        # Embedding calls run in executor threads, so guard the in-memory layer
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _key(self, text: str) -> str:
+        """Return the SHA-256 cache key for a text under the configured model."""
+        return hashlib.sha256((self.model_name + "\x00" + text).encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.npy")
+
+    def _get(self, key: str, disk: bool = True):
+        """Return a cached vector from memory or disk, or None if it was never computed."""
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                return vector
+        if not disk:
+            return None
+
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            vector = np.load(path)
+        except (OSError, ValueError) as e:
+            logger.warning("Discarding unreadable cached embedding", path=path, error=str(e))
+            return None
+        self._remember(key, vector)
+        return vector
+
+    def _remember(self, key: str, vector: np.ndarray):
+        vector.setflags(write=False)
+        with self._lock:
+            self._memory[key] = vector
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.maxsize:
+                self._memory.popitem(last=False)
+
+    def _put(self, key: str, vector: np.ndarray):
+        """Store a freshly computed vector in memory and on disk."""
+        self._remember(key, vector)
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                np.save(f, vector)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning("Failed to persist embedding", path=path, error=str(e))
+
+    def embed_queries(self, texts: List[str]) -> np.ndarray:
+        """
+        Embed query texts as a float32 matrix through the in-memory layer only.
+
+        Queries are open-ended user input, so persisting one file per distinct query would
+        grow the disk cache without bound; the bounded LRU still serves repeated questions.
+
+        Args:
+            texts (List[str]): The query texts.
+
+        Returns:
+            np.ndarray: One row per query, in input order.
+        """
+        keys = [self._key(text) for text in texts]
+        vectors = [self._get(key, disk=False) for key in keys]
+
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            computed = self.embeddings.embed_documents([texts[i] for i in missing])
+            for i, values in zip(missing, computed):
+                vector = np.asarray(values, dtype="float32")
+                self._remember(keys[i], vector)
+                vectors[i] = vector
+        return np.stack(vectors)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed documents, sending only cache misses to the underlying model."""
+        keys = [self._key(text) for text in texts]
+        vectors = [self._get(key) for key in keys]
+
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            computed = self.embeddings.embed_documents([texts[i] for i in missing])
+            for i, values in zip(missing, computed):
+                vector = np.asarray(values, dtype="float32")
+                self._put(keys[i], vector)
+                vectors[i] = vector
+        logger.info(
+            "Embedded documents",
+            total=len(texts),
+            cache_hits=len(texts) - len(missing),
+        )
+
+        return [vector.tolist() for vector in vectors]
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a query text through the in-memory layer only."""
+        key = self._key(text)
+        vector = self._get(key, disk=False)
+        if vector is None:
+            vector = np.asarray(self.embeddings.embed_query(text), dtype="float32")
+            self._remember(key, vector)
+        return vector.tolist()
@@ -0,0 +1,36 @@
+# src/core/ingest_worker.py
+
+import asyncio
+
+import structlog
+from src.config import get_config
+from src.core.qa_system import QASystem
+from src.utils.logging_configs import configure_logging
+
+configure_logging()
+logger = structlog.get_logger(__name__)
+
+
+def ingest_pdf(pdf_path: str, original_filename: str):
+    """
+    Parse and embed a PDF, writing the resulting vector store to `VECTOR_STORE_PATH`.
+
+    Runs in a worker process, so it builds its own QASystem instead of sharing the
+    live one; the caller reloads the saved vector store once this returns.
+
+    Args:
+        pdf_path (str): The file path of the uploaded PDF.
+        original_filename (str): The original filename of the PDF.
+    """
+    asyncio.run(_ingest(pdf_path, original_filename))
+
+
+async def _ingest(pdf_path: str, original_filename: str):
+    logger.info("Ingesting document in worker", filename=original_filename)
+    # A fresh instance per job: the cached one would outlive this event loop, along with its
+    # database connection, and would skip the rebuild once its store counts as loaded
+    qa_system = QASystem(get_config())
+    try:
+        await qa_system.load_or_create_vector_store(pdf_path, original_filename)
+    finally:
+        await qa_system.document_service.close()
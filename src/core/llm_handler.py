@@ -1,19 +1,46 @@
-from typing import Dict
-import logging
+from typing import Any, AsyncIterator, Dict, List, Optional
+from functools import lru_cache
 from src.config import Config
 from src.llm_providers.llm_factory import LLMFactory
 from src.core.conversation_manager import ConversationManager
 from src.utils.error_handler import handle_errors
-from textstat import flesch_reading_ease
-import json
+import re
+import textwrap
 import structlog
 from src.utils.logging_configs import configure_logging
 import asyncio
-from src.llm_providers.ollama_provider import OllamaProvider
 
 configure_logging()
 logger = structlog.get_logger(__name__)
 
+# Prompt template, split so the part that depends only on the retrieved context comes first.
+# Dedented at import so no indentation whitespace is sent to the provider.
+_PROMPT_PREFIX = textwrap.dedent(
+    """
+    Context: {context}
+
+    Conversation History:
+    """
+)
+_PROMPT_SUFFIX = textwrap.dedent(
+    """\
+    {conversation_history}
+
+    Human: {question}
+
+    Assistant: Let me analyze the context and conversation history to provide an accurate answer.
+    """
+)
+# The configured steps are the whole block; no heading of their own is added to the prompt
+_COT_TEMPLATE = "\n\n{steps}"
+_EXAMPLES_TEMPLATE = "\n\nExamples:\n{examples}"
+
+# Runs of vowels approximate syllables well enough for a readability bonus
+_VOWEL_RUNS = re.compile(r"[aeiouy]+")
+
+# Domain keywords rewarded in answers, stored lowercase for case-insensitive matching
+_KEYWORDS = frozenset(("moneyme", "financial", "loan", "income", "assets", "strategy"))
+
 
 class LLMHandler:
     """Handles LLM provider interactions and conversation management."""
@@ -22,50 +49,59 @@ class LLMHandler:
         """Initializes LLMHandler with config, LLM provider, and conversation manager."""
         self.config = config
         self.llm_provider = llm_provider or LLMFactory.get_provider(config)
-        self.conversation_manager = conversation_manager or ConversationManager()
-        self.ollama_provider = OllamaProvider(config)  #
+        self.conversation_manager = conversation_manager or ConversationManager(
+            token_budget=int(
+                self.llm_provider.get_context_window() * config.CONVERSATION_TOKEN_RATIO
+            )
+        )
+        # Prompt additions derived from config, which never changes after startup
+        self._cot_suffix = (
+            _COT_TEMPLATE.format_map(
+                {"steps": "\n".join(config.CHAIN_OF_THOUGHTS_PROMPT)}
+            )
+            if config.CHAIN_OF_THOUGHTS_ENABLED and config.CHAIN_OF_THOUGHTS_PROMPT
+            else ""
+        )
+        self._examples_block = (
+            _EXAMPLES_TEMPLATE.format_map(
+                {"examples": "\n".join(config.EXAMPLE_PROMPTS)}
+            )
+            if config.EXAMPLE_PROMPTS
+            else ""
+        )
 
     @handle_errors
     async def generate_response(
-        self, session_id: str, context: str, question: str
+        self,
+        session_id: str,
+        context: List[Dict[str, Any]],
+        question: str,
+        conversation_history: Optional[str] = None,
     ) -> Dict[str, str]:
-        """Generates a response from the LLM based on context, question, and conversation history."""
-        try:
-            # Parse the context JSON and format the context for the LLM
-            context_data = json.loads(context)
-            formatted_context = self._format_context(context_data)
-
-            # Get the conversation history summary for the session (this is a synchronous call)
-            conversation_history = self.conversation_manager.get_conversation_summary(
-                session_id
-            )
+        """Generates a response from the LLM based on context, question, and conversation history.
 
-            # Create the initial prompt for the LLM
-            prompt = self._create_prompt(
-                formatted_context, question, conversation_history
+        A `conversation_history` summary already fetched by the caller is used as-is.
+        """
+        try:
+            prompt = self._build_prompt(
+                session_id, context, question, conversation_history
             )
 
-            # If Chain of Thoughts is enabled, modify the prompt
-            if self.config.CHAIN_OF_THOUGHTS_ENABLED:
-                prompt = self._add_chain_of_thoughts(prompt)
-
-            # If example prompts are provided, append them to the prompt
-            if self.config.EXAMPLE_PROMPTS:
-                prompt += "\n\nExamples:\n"
-                prompt += "\n".join(self.config.EXAMPLE_PROMPTS)
-
             # Generate a response from the LLM
             try:
-                response = await self.ollama_provider.generate_response(prompt)
+                response = await self.llm_provider.generate_response(prompt)
             except Exception as e:
                 logger.error(
-                    f"Failed to generate response from provider {self.llm_provider.get_provider_name()}: {e}"
+                    "Failed to generate response from provider",
+                    provider=self.llm_provider.get_provider_name(),
+                    error=str(e),
                 )
                 return {"error": f"Failed to generate response: {e}"}
 
-            # Add the user question and LLM response to the conversation history (sync call)
-            self.conversation_manager.add_message(session_id, "user", question)
-            self.conversation_manager.add_message(session_id, "assistant", response)
+            # Add the user question and LLM response to the conversation history in one call
+            self.conversation_manager.add_messages(
+                session_id, (("user", question), ("assistant", response))
+            )
 
             # Evaluate the quality of the generated response
             quality_score = self._evaluate_answer_quality(response)
@@ -76,97 +112,136 @@ class LLMHandler:
                 "quality_score": quality_score,
             }
 
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse context JSON: {e}")
-            raise
         except Exception as e:
-            logger.exception(f"Unexpected error in generate_response: {str(e)}")
+            logger.exception("Unexpected error in generate_response", error=str(e))
             raise
 
-    def _create_prompt(
-        self, context: str, question: str, conversation_history: str
+    def _build_prompt(
+        self,
+        session_id: str,
+        context: List[Dict[str, Any]],
+        question: str,
+        conversation_history: Optional[str],
     ) -> str:
-        """Creates a prompt using context, question, and conversation history."""
+        """Formats the context and history into the full prompt sent to the provider."""
+        formatted_context = self._format_context(context)
 
-        return f"""
-        Context: {context}
+        # Get the conversation history summary for the session (this is a synchronous call)
+        if conversation_history is None:
+            conversation_history = self.conversation_manager.get_conversation_summary(
+                session_id, question
+            )
 
-        Conversation History:
-        {conversation_history}
+        # Create the initial prompt for the LLM
+        prompt = self._create_prompt(formatted_context, question, conversation_history)
 
-        Human: {question}
+        # If Chain of Thoughts is enabled, modify the prompt
+        return self._add_chain_of_thoughts(prompt)
 
-        Assistant: Let me analyze the context and conversation history to provide an accurate answer.
+    async def generate_response_stream(
+        self,
+        session_id: str,
+        context: List[Dict[str, Any]],
+        question: str,
+        conversation_history: Optional[str] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Streams a response as {"token": ...} events, then a final result like `generate_response`.
+
+        The exchange is only recorded once the stream completes; provider errors propagate.
         """
+        prompt = self._build_prompt(session_id, context, question, conversation_history)
+
+        chunks = []
+        async for token in self.llm_provider.generate_response_stream(prompt):
+            chunks.append(token)
+            yield {"token": token}
+
+        response = "".join(chunks).strip()
+        self.conversation_manager.add_messages(
+            session_id, (("user", question), ("assistant", response))
+        )
+        yield {
+            "answer": response,
+            "source": self.llm_provider.__class__.__name__,
+            "quality_score": self._evaluate_answer_quality(response),
+        }
 
     def _create_prompt(
         self, context: str, question: str, conversation_history: str
     ) -> str:
         """Creates a prompt using context, question, conversation history, and example prompts."""
+        # The context-only prefix stays byte-identical across turns, so providers can cache it;
+        # the examples block was rendered once in __init__
+        return "".join(
+            (
+                _PROMPT_PREFIX.format_map({"context": context}),
+                _PROMPT_SUFFIX.format_map(
+                    {"conversation_history": conversation_history, "question": question}
+                ),
+                self._examples_block,
+            )
+        )
 
-        # Start with the basic prompt that includes context, question, and conversation history
-        prompt = f"""
-        Context: {context}
-
-        Conversation History:
-        {conversation_history}
-
-        Human: {question}
-
-        Assistant: Let me analyze the context and conversation history to provide an accurate answer.
-        """
-
-        # If example prompts are configured, append them
-        if self.config.EXAMPLE_PROMPTS:
-            prompt += "\n\nExamples:\n"
-            prompt += "\n".join(self.config.EXAMPLE_PROMPTS)
-
-        return prompt
+    def _add_chain_of_thoughts(self, prompt: str) -> str:
+        """Appends the configured Chain of Thoughts steps to the prompt, if enabled."""
+        return prompt + self._cot_suffix
 
-    def _format_context(self, context_data):
+    @staticmethod
+    def _format_context(context_data):
         """Formats context data into readable sections of text."""
-        formatted_context = ""
+        parts = []
+        append = parts.append
         for item in context_data:
-            if item["type"] == "text":
-                formatted_context += (
-                    f"Header: {item['header']}\nContent: {item['content']}\n\n"
-                )
-            elif item["type"] == "table":
+            item_type = item["type"]
+            if item_type == "text":
+                append(f"Header: {item['header']}\nContent: {item['content']}\n\n")
+            elif item_type == "table":
                 # Ensure that all headers are strings, replace None with empty strings if necessary
                 headers = [
                     str(header) if header is not None else ""
                     for header in item.get("headers", [])
                 ]
-                formatted_context += f"Table:\nHeaders: {', '.join(headers)}\n"
-                for row in item["data"]:
-                    formatted_context += f"{', '.join(map(str, row))}\n"
-                formatted_context += "\n"
-        return formatted_context
+                append(f"Table:\nHeaders: {', '.join(headers)}\n")
+                rows = item.get("rows")
+                if rows is not None:
+                    # Already rendered one comma-separated line per row
+                    if rows:
+                        append(rows)
+                        append("\n")
+                else:
+                    # Rows go in as-is, without an extra copy per row just to attach the newline
+                    for row in item["data"]:
+                        append(", ".join(map(str, row)))
+                        append("\n")
+                append("\n")
+        return "".join(parts)
 
     def _evaluate_answer_quality(self, answer: str, context: str = None) -> int:
         """Evaluates the quality of the generated answer based on multiple factors."""
         quality_score = 0
+        # Lowercase and tokenize once; every factor below reads from these
+        answer_l = answer.lower()
+        answer_words = answer_l.split()
 
         # Factor 1: Length of the answer
-        length_score = min(len(answer.split()) // 10, 5)  # Max 5 points for length
+        length_score = min(len(answer_words) // 10, 5)  # Max 5 points for length
         quality_score += length_score
 
         # Factor 2: Keyword relevance
-        keywords = ["MONEYME", "financial", "loan", "income", "assets", "strategy"]
-        keyword_score = sum(keyword.lower() in answer.lower() for keyword in keywords)
+        keyword_score = sum(keyword in answer_l for keyword in _KEYWORDS)
         keyword_score = min(keyword_score, 3)  # Max 3 points for keywords
         quality_score += keyword_score
 
         # Factor 3: Readability score
-        readability_score = flesch_reading_ease(answer)
+        readability_score = _flesch_fast(answer)
         if readability_score > 60:
             quality_score += 2  # Max 2 points for readability
 
         # Factor 4: Context relevance (if context is provided)
         if context:
-            relevance_score = sum(
-                1 for word in answer.split() if word.lower() in context.lower()
-            )
+            # Hash lookups against the context's words instead of a substring scan per word
+            context_words = frozenset(context.lower().split())
+            relevance_score = sum(1 for word in answer_words if word in context_words)
             relevance_score = min(
                 relevance_score // 5, 3
             )  # Max 3 points for context relevance
@@ -179,4 +254,17 @@ class LLMHandler:
     def clear_conversation(self, session_id: str):
         """Clears the conversation history for the given session ID. -> not really used for now good to have for scalability"""
         self.conversation_manager.clear_conversation(session_id)
-        logger.info(f"Cleared conversation history for session {session_id}")
+        logger.info("Cleared conversation history", session_id=session_id)
+
+
+@lru_cache(maxsize=512)
+def _flesch_fast(text: str) -> float:
+    """Approximates the Flesch reading ease score; answers under 10 words score 0."""
+    words = text.split()
+    if len(words) < 10:
+        return 0.0
+    sentences = max(1, sum(text.count(c) for c in ".!?"))
+    syllables = sum(
+        max(1, len(_VOWEL_RUNS.findall(word))) for word in text.lower().split()
+    )
+    return 206.835 - 1.015 * (len(words) / sentences) - 84.6 * (syllables / len(words))
@@ -0,0 +1,87 @@
+# src/core/onnx_embeddings.py
+
+from typing import List
+import os
+
+import numpy as np
+import structlog
+from langchain_core.embeddings import Embeddings
+from src.utils.error_handler import ConfigurationError
+
+logger = structlog.get_logger(__name__)
+
+
+class OnnxEmbeddings(Embeddings):
+    """Sentence embeddings computed by an exported (optionally int8-quantized) ONNX model."""
+
+    def __init__(self, model_path: str, device: str = "cpu", batch_size: int = 64):
+        """
+        Initialize the OnnxEmbeddings model.
+
+        The model directory is produced by `optimum-cli export onnx` and, for int8, by
+        `optimum-cli onnxruntime quantize`; it holds the tokenizer files and one `.onnx` file.
+
+        Args:
+            model_path (str): Directory containing the exported model and its tokenizer.
+            device (str): "cuda" to run on the CUDA execution provider, otherwise "cpu".
+            batch_size (int): Number of texts tokenized and run per inference call.
+        """
+        # Imported here so the other backends never load onnxruntime
+        try:
+            import onnxruntime
+            from transformers import AutoTokenizer
+        except ImportError as e:
+            raise ConfigurationError(
+                "The onnx-int8 embedding backend requires onnxruntime "
+                "(pip install -r requirements.txt)"
+            ) from e
+
+        model_files = sorted(f for f in os.listdir(model_path) if f.endswith(".onnx"))
+        if not model_files:
+            raise ConfigurationError(f"No ONNX model found in {model_path}")
+        # Prefer the quantized export when both are present
+        model_file = next((f for f in model_files if "quantized" in f), model_files[0])
+
+        providers = ["CPUExecutionProvider"]
+        if device == "cuda":
+            providers.insert(0, "CUDAExecutionProvider")
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_path, model_file), providers=providers
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path)
+        self.batch_size = batch_size
+        logger.info(
+            "Loaded ONNX embedding model",
+            model_file=model_file,
+            providers=self.session.get_providers(),
+        )
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Encode texts into unit-normalized, mean-pooled float32 sentence embeddings."""
+        batches = []
+        for start in range(0, len(texts), self.batch_size):
+            tokens = self.tokenizer(
+                texts[start : start + self.batch_size],
+                padding=True,
+                truncation=True,
+                return_tensors="np",
+            )
+            feed = {k: v for k, v in tokens.items() if k in self.input_names}
+            token_embeddings = self.session.run(None, feed)[0]
+
+            # Mean-pool over real tokens only, as sentence-transformers does
+            mask = tokens["attention_mask"][..., np.newaxis].astype("float32")
+            summed = (token_embeddings * mask).sum(axis=1)
+            pooled = summed / np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            batches.append(pooled.astype("float32"))
+        return np.concatenate(batches) if batches else np.empty((0, 0), dtype="float32")
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed a list of documents."""
+        return self.encode(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a single query text."""
+        return self.encode([text])[0].tolist()
@@ -1,14 +1,22 @@
 import pdfplumber
-import json
+import pypdfium2 as pdfium
+import pypdfium2.raw as pdfium_c
 from typing import List, Dict, Any
 from src.core.custom_text_splitter import MetadataTextSplitter
 import structlog
 from src.utils.logging_configs import configure_logging
 import asyncio
+import re
 
 configure_logging()
 logger = structlog.get_logger(__name__)
 
+# All-uppercase lines ("RISK FACTORS") or numbered ones ("3. Income", "12")
+_HEADER_RE = re.compile(r"[^a-z]*[A-Z][^a-z]*\Z|\s*\d+(?:\.|\s*\Z)")
+
+# Splitting keeps no per-call state, so every parser shares one splitter
+_TEXT_SPLITTER = MetadataTextSplitter(chunk_size=1000, chunk_overlap=200)
+
 
 class PDFParser:
     """Parses PDF files, extracting content and metadata."""
@@ -33,49 +41,76 @@ class PDFParser:
 
     def _extract_content_sync(self) -> List[Dict[str, Any]]:
         """Synchronous method to extract content from the PDF."""
+        try:
+            return self._extract_with_pdfium()
+        except Exception as e:
+            logger.warning(
+                "pdfium extraction failed, falling back to pdfplumber",
+                error=str(e),
+                pdf_path=self.pdf_path,
+            )
+        return self._extract_with_pdfplumber()
+
+    def _extract_with_pdfium(self) -> List[Dict[str, Any]]:
+        """Extracts text with pdfium, leaving pdfplumber only the pages that can hold tables."""
         content = []
+        headers = []
+        pdf = pdfium.PdfDocument(self.pdf_path)
+        tables_pdf = None
+        try:
+            for page_number, page in enumerate(pdf):
+                text = page.get_textpage().get_text_range()
+                tables = []
+                # pdfplumber's default table finder works from ruling lines, so a page
+                # without vector paths has no tables and skips its slow layout analysis
+                paths = page.get_objects(filter=[pdfium_c.FPDF_PAGEOBJ_PATH])
+                if next(paths, None) is not None:
+                    if tables_pdf is None:
+                        tables_pdf = pdfplumber.open(self.pdf_path)
+                    tables = tables_pdf.pages[page_number].extract_tables()
+                content.extend(self._process_page(text, tables, headers))
+        finally:
+            pdf.close()
+            if tables_pdf is not None:
+                tables_pdf.close()
+        # Merged only once every page succeeded, so a fallback never sees partial headers
+        self.headers.extend(headers)
+        return content
+
+    def _extract_with_pdfplumber(self) -> List[Dict[str, Any]]:
+        """Extracts content with pdfplumber, page by page."""
+        content = []
+        headers = []
         with pdfplumber.open(self.pdf_path) as pdf:
             for page in pdf.pages:
-                page_content = self._process_page(page)
-                content.extend(page_content)
+                text = page.extract_text() or ""
+                content.extend(self._process_page(text, page.extract_tables(), headers))
+        self.headers.extend(headers)
         return content
 
-    def _process_page(self, page) -> List[Dict[str, Any]]:
-        """Processes a single PDF page to extract text and tables."""
-        page_content = []
-        text = page.extract_text()
-        tables = page.extract_tables()
-
-        # Process text content
-        lines = text.split("\n")
-        current_header = ""
-        current_text = []
-
-        for line in lines:
-            if self._is_header(line):
-                if current_text:
-                    page_content.append(
-                        {
-                            "type": "text",
-                            "header": current_header,
-                            "content": "\n".join(current_text),
-                        }
-                    )
-                    current_text = []
-                current_header = line
-                self.headers.append(line)
-            else:
-                current_text.append(line)
-
-        # Add any remaining text
-        if current_text:
-            page_content.append(
-                {
-                    "type": "text",
-                    "header": current_header,
-                    "content": "\n".join(current_text),
-                }
-            )
+    def _process_page(
+        self, text: str, tables: List[List[List[str]]], headers: List[str]
+    ) -> List[Dict[str, Any]]:
+        """Processes a single page's extracted text and tables, collecting its headers."""
+        # Process text content: find the header lines in one pass, then slice out and
+        # join the run of body lines after each header exactly once
+        lines = text.splitlines()
+        is_header = self._is_header
+        header_indices = [i for i, line in enumerate(lines) if is_header(line)]
+        headers.extend(lines[i] for i in header_indices)
+
+        starts = [0] + [i + 1 for i in header_indices]
+        ends = header_indices + [len(lines)]
+        section_headers = [""] + [lines[i] for i in header_indices]
+        page_content = [
+            {
+                "type": "text",
+                "header": header,
+                "content": "\n".join(lines[start:end]),
+            }
+            for header, start, end in zip(section_headers, starts, ends)
+            if end > start
+        ]
 
         # Process tables
         for table in tables:
@@ -86,7 +121,7 @@ class PDFParser:
 
     def _is_header(self, line: str) -> bool:
         """Determines if a line of text is a header based on format."""
-        return line.isupper() or line.strip().split(".")[0].isdigit()
+        return _HEADER_RE.match(line) is not None
 
     def _process_table(self, table: List[List[str]]) -> Dict[str, Any]:
         """Processes a table from the PDF and formats it as a dictionary."""
@@ -100,20 +135,25 @@ class PDFParser:
             content = await self.extract_content()
             chunks = []
 
-            text_splitter = MetadataTextSplitter(chunk_size=1000, chunk_overlap=200)
-
             for item in content:
                 if item["type"] == "text":
-                    text_chunks = text_splitter.split_text_with_metadata(
+                    text_chunks = _TEXT_SPLITTER.split_text_with_metadata(
                         item["content"], {"type": "text", "header": item["header"]}
                     )
                     chunks.extend(text_chunks)
                 elif item["type"] == "table":
-                    # Store the entire table as a single chunk
+                    # Store the entire table as a single chunk, one comma-separated line per
+                    # row: the form that is embedded and later shown to the LLM as-is
                     chunks.append(
                         {
-                            "content": json.dumps(item["data"]),
-                            "metadata": {"type": "table", "headers": item["headers"]},
+                            "content": "\n".join(
+                                ", ".join(map(str, row)) for row in item["data"]
+                            ),
+                            "metadata": {
+                                "type": "table",
+                                "format": "rows",
+                                "headers": tuple(item["headers"]),
+                            },
                         }
                     )
 
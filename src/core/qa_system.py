@@ -1,15 +1,17 @@
-import logging
-import uuid
 import os
-from src.config import Config
-from src.core.vector_store_service import VectorStoreService
+import re
+from src.config import Config, get_config
+from src.core.vector_store_service import VectorStoreService, normalize_query
 from src.core.document_service import DocumentService
 from src.core.llm_handler import LLMHandler
-from src.core.conversation_manager import ConversationManager
+from src.core.semantic_cache import SemanticCache
 from src.utils.error_handler import handle_errors, QASystemError
 from src.core.pdf_parser import PDFParser
 import asyncio
-import aiofiles
+import fcntl
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import AsyncIterator
 
 import structlog
 from src.utils.logging_configs import configure_logging
@@ -19,6 +21,35 @@ configure_logging()
 
 logger = structlog.get_logger(__name__)
 
+# Canonical hyphenated UUID, the form issued to clients; checked without building a UUID
+_UUID_RE = re.compile(
+    r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}"
+)
+
+
+def _is_uuid(value: str) -> bool:
+    return _UUID_RE.fullmatch(value) is not None
+
+
+def _new_session_id() -> str:
+    """Returns a random UUID4 in canonical form, formatted straight from os.urandom."""
+    raw = bytearray(os.urandom(16))
+    raw[6] = (raw[6] & 0x0F) | 0x40  # version 4
+    raw[8] = (raw[8] & 0x3F) | 0x80  # RFC 4122 variant
+    digits = raw.hex()
+    return f"{digits[:8]}-{digits[8:12]}-{digits[12:16]}-{digits[16:20]}-{digits[20:]}"
+
+
+@asynccontextmanager
+async def _store_write_lock(path: str):
+    """Holds an exclusive lock on the saved vector store, shared with other processes."""
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, ".write.lock"), "a") as lock_file:
+        # flock blocks until the other writer is done, so wait for it off the event loop;
+        # closing the file releases the lock
+        await asyncio.to_thread(fcntl.flock, lock_file, fcntl.LOCK_EX)
+        yield
+
 
 class QASystem:
     """Handles the question-answer system, including document and conversation management."""
@@ -29,39 +60,66 @@ class QASystem:
         self.vector_store_service = VectorStoreService(config)
         self.document_service = DocumentService(config)
         self.llm_handler = LLMHandler(config)
-        self.conversation_manager = ConversationManager()
+        # One history per session, shared with the LLM handler that records each exchange
+        self.conversation_manager = self.llm_handler.conversation_manager
+        # Set once a vector store is in memory, so request paths can skip re-checking it
+        self._loaded = False
+        self._load_lock = asyncio.Lock()
+        self.semantic_cache = (
+            SemanticCache(
+                self.vector_store_service.embeddings,
+                threshold=config.SEMANTIC_CACHE_THRESHOLD,
+                max_size=config.SEMANTIC_CACHE_MAX_SIZE,
+            )
+            if config.SEMANTIC_CACHE_ENABLED
+            else None
+        )
 
     @handle_errors
     async def process_single_query(self, question: str, pdf_path: str = None) -> dict:
         "Processes a single question query and returns the answer, source, and quality score."
         try:
-            await self._ensure_vector_store_loaded(pdf_path)
-
-            if not await self.vector_store_service.is_loaded():
+            if not await self._ensure_vector_store_loaded(pdf_path):
                 raise QASystemError(
                     "Vector store is not loaded. Please upload a PDF first."
                 )
 
-            context = await self.vector_store_service.query(question)
-            logger.debug("Context retrieved", context=context)
+            # Normalized once, so the cache lookup's embedding is the one the search reuses
+            question_key = normalize_query(question)
+            question_vector = None
+            if self.semantic_cache:
+                cached, question_vector = await self.semantic_cache.lookup(question_key)
+                if cached is not None:
+                    return cached
+
+            context = await self.vector_store_service.query(
+                question_key, question_vector
+            )
+            logger.debug("Context retrieved", items=len(context))
 
             result = await self.llm_handler.generate_response(None, context, question)
             logger.debug("LLM response", result=result)
 
+            # Failures are never cached; the next similar question tries the provider again
+            if "error" in result:
+                raise QASystemError(result["error"])
             if "answer" not in result:
                 raise QASystemError("LLM response missing 'answer' key.")
 
-            return {
+            response = {
                 "answer": result["answer"],
                 "source": result["source"],
                 "quality_score": result["quality_score"],
             }
+            if self.semantic_cache:
+                self.semantic_cache.add(question_vector, response)
+            return response
 
         except QASystemError as e:
-            logger.error(f"QASystemError in process_single_query: {str(e)}")
+            logger.error("QASystemError in process_single_query", error=str(e))
             raise
         except Exception as e:
-            logger.exception(f"Unexpected error in process_single_query: {str(e)}")
+            logger.exception("Unexpected error in process_single_query", error=str(e))
             raise QASystemError(f"An unexpected error occurred: {str(e)}")
 
     @handle_errors
@@ -70,45 +128,53 @@ class QASystem:
     ) -> dict:
         "Processes a chat query by managing conversation history and retrieving the answer."
         try:
-            await self._ensure_vector_store_loaded(pdf_path)
+            session_id = await self._start_chat_session(session_id, pdf_path)
 
-            context = await self.vector_store_service.query(question)
-            logger.debug("Context retrieved", context=context)
+            # Cache hits are scoped to the session so answers never leak between histories
+            question_key = normalize_query(question)
+            cached, question_vector = None, None
+            if self.semantic_cache:
+                cached, question_vector = await self.semantic_cache.lookup(
+                    question_key, scope=session_id
+                )
+                if cached is not None:
+                    # The LLM handler is bypassed, so record the exchange here instead
+                    self.conversation_manager.add_messages(
+                        session_id,
+                        (("user", question), ("assistant", cached["answer"])),
+                    )
+                    result = cached
 
-            if not session_id:
-                session_id = str(uuid.uuid4())
-            else:
-                try:
-                    uuid.UUID(session_id)
-                except ValueError:
-                    logger.error("Invalid session ID", session_id=session_id)
-                    raise QASystemError("Invalid session ID format")
-
-            result = await self.llm_handler.generate_response(
-                session_id, context, question
-            )
-            logger.debug("LLM response", result=result)
+            if cached is None:
+                # Read before retrieval; it is an in-memory lookup with nothing to overlap
+                history = self.conversation_manager.get_conversation_summary(
+                    session_id, question
+                )
+                context = await self.vector_store_service.query(
+                    question_key, question_vector
+                )
+                logger.debug("Context retrieved", items=len(context))
 
-            if "error" in result:
-                raise QASystemError(result["error"])
+                result = await self.llm_handler.generate_response(
+                    session_id, context, question, conversation_history=history
+                )
+                logger.debug("LLM response", result=result)
 
-            # Use synchronous calls for add_message, as they don't require await
-            self.conversation_manager.add_message(session_id, "user", question)
-            self.conversation_manager.add_message(
-                session_id, "assistant", result["answer"]
-            )
+                if "error" in result:
+                    raise QASystemError(result["error"])
 
-            conversation_history = self.conversation_manager.get_conversation_history(
-                session_id
-            )
+                if self.semantic_cache:
+                    self.semantic_cache.add(
+                        question_vector,
+                        {
+                            "answer": result["answer"],
+                            "source": result["source"],
+                            "quality_score": result["quality_score"],
+                        },
+                        scope=session_id,
+                    )
 
-            return {
-                "session_id": session_id,
-                "answer": result["answer"],
-                "source": result["source"],
-                "quality_score": result["quality_score"],
-                "conversation_history": conversation_history,
-            }
+            return self._chat_result(session_id, result)
         except QASystemError as e:
             logger.error("QASystemError in process_chat_query", error=str(e))
             raise
@@ -116,11 +182,102 @@ class QASystem:
             logger.exception("Unexpected error in process_chat_query", error=str(e))
             raise QASystemError(f"An unexpected error occurred: {str(e)}")
 
-    async def _ensure_vector_store_loaded(self, pdf_path: str = None):
-        "Ensures the vector store is loaded, or creates a new one if necessary."
+    async def process_chat_query_stream(
+        self, session_id: str, question: str, pdf_path: str = None
+    ) -> AsyncIterator[dict]:
+        "Streams a chat answer as a session event, token events and the final result."
+        try:
+            session_id = await self._start_chat_session(session_id, pdf_path)
+            # Validation is done by the first event, so callers can still reject the request
+            yield {"session_id": session_id}
+
+            question_key = normalize_query(question)
+            cached, question_vector = None, None
+            if self.semantic_cache:
+                cached, question_vector = await self.semantic_cache.lookup(
+                    question_key, scope=session_id
+                )
+
+            if cached is not None:
+                self.conversation_manager.add_messages(
+                    session_id, (("user", question), ("assistant", cached["answer"]))
+                )
+                yield {"token": cached["answer"]}
+                result = cached
+            else:
+                history = self.conversation_manager.get_conversation_summary(
+                    session_id, question
+                )
+                context = await self.vector_store_service.query(
+                    question_key, question_vector
+                )
+                logger.debug("Context retrieved", items=len(context))
+
+                async for event in self.llm_handler.generate_response_stream(
+                    session_id, context, question, conversation_history=history
+                ):
+                    if "token" in event:
+                        yield event
+                    else:
+                        result = event
+
+                if self.semantic_cache:
+                    self.semantic_cache.add(question_vector, result, scope=session_id)
+
+            yield self._chat_result(session_id, result)
+        except QASystemError as e:
+            logger.error("QASystemError in process_chat_query_stream", error=str(e))
+            raise
+        except Exception as e:
+            logger.exception(
+                "Unexpected error in process_chat_query_stream", error=str(e)
+            )
+            raise QASystemError(f"An unexpected error occurred: {str(e)}")
+
+    async def _start_chat_session(self, session_id: str, pdf_path: str = None) -> str:
+        "Prepares the store and history for a chat turn and returns the validated session ID."
+        await self._ensure_vector_store_loaded(pdf_path)
+        self._prune_conversations()
+
+        if not session_id:
+            return _new_session_id()
+        if not _is_uuid(session_id):
+            logger.error("Invalid session ID", session_id=session_id)
+            raise QASystemError("Invalid session ID format")
+        return session_id
+
+    def _chat_result(self, session_id: str, result: dict) -> dict:
+        "Builds the chat response for a finished turn, including the session's history."
+        return {
+            "session_id": session_id,
+            "answer": result["answer"],
+            "source": result["source"],
+            "quality_score": result["quality_score"],
+            "conversation_history": self.conversation_manager.get_conversation_history(
+                session_id
+            ),
+        }
+
+    def _prune_conversations(self):
+        "Drops chat sessions older than the configured maximum age."
+        self.conversation_manager.prune_old_conversations(
+            self.config.CONVERSATION_MAX_AGE_SECONDS
+        )
+
+    async def _ensure_vector_store_loaded(self, pdf_path: str = None) -> bool:
+        "Ensures the vector store is loaded or created, returning whether it holds documents."
         if pdf_path:
-            await self.load_or_create_vector_store(pdf_path, os.path.basename(pdf_path))
-        elif not await self.vector_store_service.is_loaded():
+            return await self.load_or_create_vector_store(
+                pdf_path, os.path.basename(pdf_path)
+            )
+        if await self.vector_store_service.is_loaded():
+            return True
+
+        async with self._load_lock:
+            # Concurrent cold-start requests queue here; only the first one loads
+            if await self.vector_store_service.is_loaded():
+                return True
+
             last_pdf = await self.document_service.get_last_processed_pdf()
             if last_pdf and await self.vector_store_service.vector_store_exists(
                 self.config.VECTOR_STORE_PATH
@@ -128,39 +285,80 @@ class QASystem:
                 await self.vector_store_service.load_vector_store(
                     self.config.VECTOR_STORE_PATH
                 )
-            else:
-                raise QASystemError("No vector store found. Please upload a PDF first.")
+                self._loaded = True
+                return await self.vector_store_service.is_loaded()
+        raise QASystemError("No vector store found. Please upload a PDF first.")
+
+    @property
+    def loaded(self) -> bool:
+        "Whether a vector store has been loaded or created in this process."
+        return self._loaded
 
     @handle_errors
-    async def load_or_create_vector_store(self, pdf_path: str, original_filename: str):
-        "Loads an existing vector store or creates a new one from a given PDF."
+    async def load_or_create_vector_store(
+        self, pdf_path: str, original_filename: str
+    ) -> bool:
+        "Loads an existing vector store or creates a new one, returning whether it holds documents."
         try:
-            if not await self.vector_store_service.is_loaded():
-                logger.info("Creating new vector store", pdf_path=pdf_path)
-                pdf_parser = PDFParser(pdf_path)
+            version = self.vector_store_service.vector_store_version
+            async with self._load_lock:
+                if self.vector_store_service.vector_store_version != version:
+                    # Another request built or loaded the store while this one waited
+                    logger.info("Vector store already refreshed", pdf_path=pdf_path)
+                    return await self.vector_store_service.is_loaded()
+                if not await self.vector_store_service.is_loaded():
+                    await self._add_document_to_store(pdf_path, original_filename)
+                else:
+                    logger.info("Loading existing vector store")
+                    await self.vector_store_service.load_vector_store(
+                        self.config.VECTOR_STORE_PATH
+                    )
 
-                sections_with_metadata = (
-                    await pdf_parser.extract_sections_with_metadata()
-                )
-                await self.vector_store_service.create_vector_store(
-                    sections_with_metadata
-                )
-                await self.vector_store_service.save_vector_store(
-                    self.config.VECTOR_STORE_PATH
-                )
-                await self.document_service.add_document(pdf_path, original_filename)
-            else:
-                logger.info("Loading existing vector store")
-                await self.vector_store_service.load_vector_store(
-                    self.config.VECTOR_STORE_PATH
-                )
+                self._loaded = True
 
             logger.info("Vector store operation completed", pdf_path=pdf_path)
+            # Both branches leave a saved, non-empty store in memory or raise
+            return True
         except Exception as e:
             logger.exception("Error in load_or_create_vector_store", exc_info=True)
             logger.error("Error details", error_message=str(e))
             raise QASystemError(f"Error processing document: {str(e)}")
 
+    async def _add_document_to_store(self, pdf_path: str, original_filename: str):
+        "Parses a PDF into the saved vector store, keeping the documents already indexed in it."
+        store_path = self.config.VECTOR_STORE_PATH
+        # Ingest workers and CLI runs write the same files, so they take turns
+        async with _store_write_lock(store_path):
+            # Start from the latest saved store rather than this process's copy, which an
+            # earlier writer may have superseded
+            if await self.vector_store_service.vector_store_exists(store_path):
+                await self.vector_store_service.load_vector_store(
+                    store_path, writable=True
+                )
+                if await self.document_service.is_document_processed(pdf_path):
+                    logger.info("Document already indexed", pdf_path=pdf_path)
+                    return
+
+            logger.info("Adding document to vector store", pdf_path=pdf_path)
+            pdf_parser = PDFParser(pdf_path)
+            sections_with_metadata = await pdf_parser.extract_sections_with_metadata()
+            await self.vector_store_service.add_to_vector_store(sections_with_metadata)
+            await self.vector_store_service.save_vector_store(store_path)
+            await self.document_service.add_document(pdf_path, original_filename)
+        if self.semantic_cache:
+            self.semantic_cache.clear()
+
+    async def refresh_vector_store(self):
+        "Reloads the saved vector store, e.g. at startup or after a background worker rebuilt it."
+        async with self._load_lock:
+            await self.vector_store_service.load_vector_store(
+                self.config.VECTOR_STORE_PATH
+            )
+            if self.semantic_cache:
+                self.semantic_cache.clear()
+            self._loaded = True
+        logger.info("Vector store refreshed", path=self.config.VECTOR_STORE_PATH)
+
     async def list_documents(self) -> list:
         "Returns a list of all processed documents."
         try:
@@ -172,22 +370,28 @@ class QASystem:
     @handle_errors
     async def get_session_info(self, session_id: str) -> dict:
         "Retrieves session information, including conversation history and message count."
-        try:
-            uuid.UUID(session_id)
-            conversation_history = await self.conversation_manager.get_conversation(
-                session_id
-            )
-            if not conversation_history:
-                return None
-            return {
-                "session_id": session_id,
-                "conversation_history": conversation_history,
-                "message_count": len(conversation_history),
-            }
-        except ValueError:
+        if not _is_uuid(session_id):
             logger.error("Invalid session ID format", session_id=session_id)
             raise QASystemError("INVALID SESSION ID FORMAT OR DOES NOT EXIST")
 
+        # Expire stale sessions first, so an abandoned one is never reported as live
+        self._prune_conversations()
+        conversation_history = self.conversation_manager.get_conversation(session_id)
+        if not conversation_history:
+            return None
+        return {
+            "session_id": session_id,
+            "conversation_history": conversation_history,
+            "message_count": len(conversation_history),
+        }
+
     async def get_last_pdf(self) -> str:
         "Retrieves the path of the last processed PDF document."
         return await self.document_service.get_last_processed_pdf()
+
+
+@lru_cache(maxsize=1)
+def get_qa_system() -> QASystem:
+    """Returns the process-wide QASystem, creating it on first use."""
+    # Every entry point shares one instance, so the embedding model and index load once per process
+    return QASystem(get_config())
@@ -0,0 +1,93 @@
+# src/core/semantic_cache.py
+
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+import asyncio
+
+import faiss
+import numpy as np
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+
+class SemanticCache:
+    """Caches answers keyed by question embeddings and matches new questions by cosine similarity."""
+
+    def __init__(self, embeddings, threshold: float = 0.95, max_size: int = 256):
+        """
+        Initialize the SemanticCache.
+
+        Args:
+            embeddings: The embedding model used to embed incoming questions.
+            threshold (float): Minimum cosine similarity for a cached answer to be reused.
+            max_size (int): Maximum number of cached answers before the least recently used is evicted.
+        """
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.max_size = max_size
+        # One inner-product index per scope, so chat sessions never see each other's answers
+        self.indexes: Dict[Optional[str], faiss.IndexIDMap] = {}
+        self.entries: "OrderedDict[int, Tuple[Optional[str], dict]]" = OrderedDict()
+        self._next_id = 0
+
+    def embed(self, question: str) -> np.ndarray:
+        """Embed a question as a row vector; the model emits unit vectors, so inner product is cosine."""
+        vector = np.asarray(self.embeddings.embed_query(question), dtype="float32")
+        return vector.reshape(1, -1)
+
+    async def lookup(
+        self, question: str, scope: Optional[str] = None
+    ) -> Tuple[Optional[dict], np.ndarray]:
+        """
+        Look up a cached answer for a question within a scope.
+
+        Args:
+            question (str): The incoming question.
+            scope (Optional[str]): The cache scope, e.g. a chat session ID; None for single queries.
+
+        Returns:
+            Tuple[Optional[dict], np.ndarray]: The cached response (or None on a miss) and the
+                                               question embedding, to be passed back to `add`.
+        """
+        vector = await asyncio.to_thread(self.embed, question)
+        return self.get(vector, scope), vector
+
+    def get(self, vector: np.ndarray, scope: Optional[str] = None) -> Optional[dict]:
+        """Return the cached response closest to the vector if it clears the similarity threshold."""
+        index = self.indexes.get(scope)
+        if index is None or index.ntotal == 0:
+            return None
+
+        scores, ids = index.search(vector, 1)
+        if ids[0, 0] < 0 or scores[0, 0] < self.threshold:
+            return None
+
+        entry_id = int(ids[0, 0])
+        self.entries.move_to_end(entry_id)
+        logger.info("Semantic cache hit", score=float(scores[0, 0]), scope=scope)
+        return dict(self.entries[entry_id][1])
+
+    def add(self, vector: np.ndarray, response: dict, scope: Optional[str] = None):
+        """Store a response under the question embedding, evicting the least recently used entry if full."""
+        index = self.indexes.get(scope)
+        if index is None:
+            index = faiss.IndexIDMap(faiss.IndexFlatIP(vector.shape[1]))
+            self.indexes[scope] = index
+
+        entry_id = self._next_id
+        self._next_id += 1
+        index.add_with_ids(vector, np.array([entry_id], dtype="int64"))
+        self.entries[entry_id] = (scope, dict(response))
+
+        while len(self.entries) > self.max_size:
+            evicted_id, (evicted_scope, _) = self.entries.popitem(last=False)
+            evicted_index = self.indexes[evicted_scope]
+            evicted_index.remove_ids(np.array([evicted_id], dtype="int64"))
+            if evicted_index.ntotal == 0:
+                del self.indexes[evicted_scope]
+
+    def clear(self):
+        """Drop every cached answer, e.g. after the vector store has been rebuilt."""
+        self.indexes.clear()
+        self.entries.clear()
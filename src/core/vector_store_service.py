@@ -1,13 +1,31 @@
+import os
+
+# Read once when the OpenMP runtime starts, so set before faiss and torch load it: idle
+# threads then sleep instead of spinning on cores the other workers need
+os.environ.setdefault("OMP_WAIT_POLICY", "PASSIVE")
+
 from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain.docstore.document import Document
-from cachetools import TTLCache, cached
-from typing import List, Dict, Any
+from langchain_core.embeddings import Embeddings
+import faiss
+import numpy as np
+import torch
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Tuple
 from src.config import Config
+from src.core.batcher import MicroBatcher
+from src.core.embedding_cache import CachedEmbeddings
+from src.utils.error_handler import ConfigurationError
+from src.utils.ttl_cache import TTLLRUCache
 import warnings
 import logging
-import json
-import os
+import orjson
+import pickle
+import shutil
+import tempfile
 import asyncio
 
 import structlog
@@ -20,6 +38,59 @@ logger = structlog.get_logger(__name__)
 warnings.filterwarnings("ignore", category=FutureWarning, module="transformers")
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 
+# Number of chunks retrieved per question
+QUERY_TOP_K = 3
+
+# Texts per embedding call when building a store; each runs in its own executor thread
+EMBED_CHUNK_SIZE = 128
+# Embedding calls a store build runs side by side; torch's intra-op pool is split between them
+EMBED_PARALLEL_CHUNKS = 2
+
+# Retrieval results kept for repeated questions, cleared whenever the store changes
+QUERY_CACHE_SIZE = 1024
+QUERY_CACHE_TTL_SECONDS = 3600
+
+
+@lru_cache(maxsize=4)
+def _get_embeddings(
+    backend: str, model_name: str, onnx_path: str, device: str, batch_size: int
+) -> Embeddings:
+    """Creates the embedding model for a backend, loading its weights once per process."""
+    if backend == "sentence-transformers":
+        return HuggingFaceEmbeddings(
+            model_name=model_name,
+            model_kwargs={"device": device},
+            # embed_documents hands the whole chunk list to a single encode call, and
+            # unit-normalizing inside it lets inner product rank by cosine similarity
+            encode_kwargs={"batch_size": batch_size, "normalize_embeddings": True},
+        )
+    if backend == "onnx-int8":
+        from src.core.onnx_embeddings import OnnxEmbeddings
+
+        return OnnxEmbeddings(onnx_path, device=device, batch_size=batch_size)
+    raise ConfigurationError(f"Unsupported embedding backend: {backend}")
+
+
+def _text_metadata(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    return {"type": "text", "header": metadata.get("header", "")}
+
+
+def _table_metadata(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "type": "table",
+        "format": metadata.get("format", "json"),
+        "headers": metadata.get("headers", []),
+    }
+
+
+# Stored-metadata builders keyed by chunk type; chunks of any other type are skipped
+_METADATA_BUILDERS = {"text": _text_metadata, "table": _table_metadata}
+
+
+def normalize_query(query_text: str) -> str:
+    """Fold case and whitespace, so trivially different spellings share a cache entry."""
+    return " ".join(query_text.lower().split())
+
 
 class VectorStoreService:
     """Service for managing the creation, loading, and querying of the vector store."""
@@ -27,9 +98,52 @@ class VectorStoreService:
     def __init__(self, config: Config):
         """Initializes the VectorStoreService with configuration and embeddings."""
         self.config = config
-        self.embeddings = HuggingFaceEmbeddings(model_name=config.EMBEDDING_MODEL_NAME)
+        self.device = "cuda" if config.USE_GPU and torch.cuda.is_available() else "cpu"
+        # Searches retrieve k=3 for a handful of queries, which gains nothing from one OpenMP
+        # thread per core and oversubscribes the machine once several workers each start a pool
+        faiss.omp_set_num_threads(
+            config.FAISS_NUM_THREADS or max(1, min(4, (os.cpu_count() or 2) // 2))
+        )
+        # The pool size is process-wide, so it is fixed here for every caller rather than
+        # changed per call; builds then run EMBED_PARALLEL_CHUNKS encodes without oversubscribing
+        torch.set_num_threads(
+            config.EMBEDDING_NUM_THREADS
+            or max(1, (os.cpu_count() or 1) // EMBED_PARALLEL_CHUNKS)
+        )
+        # Only faiss-gpu builds ship GPU resources; faiss-cpu keeps every index on the CPU
+        self.gpu_resources = (
+            faiss.StandardGpuResources()
+            if self.device == "cuda" and hasattr(faiss, "StandardGpuResources")
+            else None
+        )
+        # Shared by every service in the process, e.g. one per ingest job in a worker
+        base_embeddings = _get_embeddings(
+            config.EMBEDDING_MODEL.lower(),
+            config.EMBEDDING_MODEL_NAME,
+            config.EMBEDDING_ONNX_PATH,
+            self.device,
+            config.EMBEDDING_BATCH_SIZE,
+        )
+        self.embeddings = CachedEmbeddings(
+            base_embeddings,
+            # Quantized vectors differ slightly, so each backend gets its own cache keys
+            model_name=(
+                f"{config.EMBEDDING_MODEL_NAME}:{config.EMBEDDING_MODEL}:normalized"
+            ),
+            cache_dir=os.path.join(config.VECTOR_STORE_PATH, "emb_cache"),
+        )
         self.vector_store = None
-        self.query_cache = TTLCache(maxsize=100, ttl=3600)
+        # Bumped whenever the store is replaced; cached results carry the version they were
+        # retrieved from, so a search that straddles a rebuild can never be served later
+        self.vector_store_version = 0
+        self.query_cache = TTLLRUCache(
+            maxsize=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL_SECONDS
+        )
+        self.query_batcher = MicroBatcher(
+            self.query_batch,
+            max_batch_size=config.QUERY_BATCH_MAX_SIZE,
+            max_wait_ms=config.QUERY_BATCH_WAIT_MS,
+        )
 
     async def vector_store_exists(self, path: str) -> bool:
         """Check if the vector store files exist at the given path."""
@@ -44,80 +158,328 @@ class VectorStoreService:
             and len(self.vector_store.index_to_docstore_id) > 0
         )
 
-    async def create_vector_store(self, chunks_with_metadata: List[Dict[str, Any]]):
-        """Creates a vector store from a list of text chunks with metadata."""
-        documents = []
+    def _prepare_chunks(
+        self, chunks_with_metadata: List[Dict[str, Any]]
+    ) -> Tuple[List[str], List[Dict[str, Any]]]:
+        """Splits chunks into the parallel text and stored-metadata lists the store is built from."""
+        # Texts and metadata go straight into parallel lists; the docstore builds the only
+        # Document objects, so no intermediate wrapper per chunk is created and discarded
+        texts = []
+        metadatas = []
         for chunk in chunks_with_metadata:
-            try:
-                metadata = chunk.get("metadata", {})
-                if metadata.get("type") == "text":
-                    doc = Document(
-                        page_content=chunk.get("content", ""),
-                        metadata={"type": "text", "header": metadata.get("header", "")},
-                    )
-                elif metadata.get("type") == "table":
-                    doc = Document(
-                        page_content=chunk.get("content", "{}"),
-                        metadata={
-                            "type": "table",
-                            "headers": metadata.get("headers", []),
-                        },
-                    )
-                else:
-                    logger.warning(
-                        "Unknown chunk type", chunk_type=metadata.get("type")
-                    )
-                    continue
-                documents.append(doc)
-            except Exception as e:
-                logger.error("Error processing chunk", error=str(e), chunk=chunk)
+            metadata = chunk.get("metadata", {})
+            chunk_type = metadata.get("type")
+            build = _METADATA_BUILDERS.get(chunk_type)
+            if build is None:
+                logger.warning("Unknown chunk type", chunk_type=chunk_type)
+                continue
+            texts.append(chunk.get("content", ""))
+            metadatas.append(build(metadata))
 
-        if not documents:
+        if not texts:
             raise ValueError("No valid documents to create vector store")
+        return texts, metadatas
+
+    async def create_vector_store(self, chunks_with_metadata: List[Dict[str, Any]]):
+        """Creates a vector store from a list of text chunks with metadata."""
+        texts, metadatas = self._prepare_chunks(chunks_with_metadata)
+        embeddings = await self._embed_documents(texts)
+        self.vector_store = await asyncio.to_thread(
+            self._build_store, texts, embeddings, metadatas
+        )
+        self.vector_store_version += 1
+        self.query_cache.clear()
+        logger.info("Created vector store", document_count=len(texts))
+
+    async def add_to_vector_store(self, chunks_with_metadata: List[Dict[str, Any]]):
+        """Adds text chunks to the current vector store, creating the store if none is loaded."""
+        if self.vector_store is None:
+            await self.create_vector_store(chunks_with_metadata)
+            return
+
+        texts, metadatas = self._prepare_chunks(chunks_with_metadata)
+        embeddings = await self._embed_documents(texts)
+        # Trained indexes keep their quantizer, so new vectors are encoded against it as-is
+        await asyncio.to_thread(
+            self.vector_store.add_embeddings, zip(texts, embeddings), metadatas
+        )
+        self.vector_store_version += 1
+        self.query_cache.clear()
+        logger.info(
+            "Added documents to vector store",
+            document_count=len(texts),
+            total=len(self.vector_store.index_to_docstore_id),
+        )
+
+    async def _embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embeds texts in chunks on executor threads, keeping the event loop free between them."""
+        chunks = [
+            texts[i : i + EMBED_CHUNK_SIZE]
+            for i in range(0, len(texts), EMBED_CHUNK_SIZE)
+        ]
+        semaphore = asyncio.Semaphore(EMBED_PARALLEL_CHUNKS)
+
+        async def embed(chunk: List[str]) -> List[List[float]]:
+            async with semaphore:
+                return await asyncio.to_thread(self.embeddings.embed_documents, chunk)
+
+        results = await asyncio.gather(*(embed(chunk) for chunk in chunks))
+        return [vector for result in results for vector in result]
 
-        self.vector_store = await FAISS.afrom_documents(documents, self.embeddings)
-        logger.info("Created vector store", document_count=len(documents))
+    def _create_index(self, dimension: int, vector_count: int) -> faiss.Index:
+        """Creates an empty inner-product FAISS index of the configured type."""
+        index_type = self.config.FAISS_INDEX_TYPE.lower()
+        precision = self.config.EMBEDDING_PRECISION.lower()
+        if precision not in ("float32", "int8"):
+            raise ValueError(f"Unsupported embedding precision: {precision}")
+        # One byte per dimension instead of four; the quantizer learns per-dimension ranges
+        # from the training vectors, which unit-normalized embeddings keep narrow
+        quantize = precision == "int8"
+        if index_type == "hnsw":
+            if quantize:
+                index = faiss.IndexHNSWSQ(
+                    dimension,
+                    faiss.ScalarQuantizer.QT_8bit,
+                    self.config.FAISS_HNSW_M,
+                    faiss.METRIC_INNER_PRODUCT,
+                )
+            else:
+                index = faiss.IndexHNSWFlat(
+                    dimension, self.config.FAISS_HNSW_M, faiss.METRIC_INNER_PRODUCT
+                )
+            index.hnsw.efConstruction = self.config.FAISS_HNSW_EF_CONSTRUCTION
+            index.hnsw.efSearch = self.config.FAISS_HNSW_EF_SEARCH
+            return index
+        if index_type == "flat":
+            if quantize:
+                return faiss.IndexScalarQuantizer(
+                    dimension,
+                    faiss.ScalarQuantizer.QT_8bit,
+                    faiss.METRIC_INNER_PRODUCT,
+                )
+            return faiss.IndexFlatIP(dimension)
+        if index_type in ("ivf_flat", "ivf_sq8"):
+            # k-means needs ~39 training points per list, so small corpora get fewer lists
+            nlist = max(1, min(self.config.FAISS_IVF_NLIST, vector_count // 39))
+            quantizer = faiss.IndexFlatIP(dimension)
+            if index_type == "ivf_flat" and not quantize:
+                # Full-precision vectors in each list: exact scores over the probed lists
+                index = faiss.IndexIVFFlat(
+                    quantizer, dimension, nlist, faiss.METRIC_INNER_PRODUCT
+                )
+            else:
+                index = faiss.IndexIVFScalarQuantizer(
+                    quantizer,
+                    dimension,
+                    nlist,
+                    faiss.ScalarQuantizer.QT_8bit,
+                    faiss.METRIC_INNER_PRODUCT,
+                )
+            index.nprobe = self.config.FAISS_IVF_NPROBE
+            # Split each search across inverted lists, not queries; batches are small
+            index.parallel_mode = 1
+            return index
+        raise ValueError(f"Unsupported FAISS index type: {index_type}")
+
+    def _build_store(
+        self,
+        texts: List[str],
+        embeddings: List[List[float]],
+        metadatas: List[Dict[str, Any]],
+    ) -> FAISS:
+        """Builds a LangChain FAISS store over precomputed embeddings."""
+        index = self._create_index(len(embeddings[0]), len(embeddings))
+        if not index.is_trained:
+            index.train(np.asarray(embeddings, dtype="float32"))
+        # Embeddings arrive unit-normalized, so inner product ranks by cosine similarity
+        vector_store = FAISS(
+            self.embeddings,
+            index,
+            InMemoryDocstore(),
+            {},
+            distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT,
+        )
+        vector_store.add_embeddings(zip(texts, embeddings), metadatas)
+        vector_store.index = self._to_gpu(vector_store.index)
+        return vector_store
+
+    def _to_gpu(self, index: faiss.Index) -> faiss.Index:
+        """Copies an index to the GPU when one is available, otherwise returns it unchanged."""
+        if self.gpu_resources is None:
+            return index
+        try:
+            return faiss.index_cpu_to_gpu(self.gpu_resources, 0, index)
+        except RuntimeError as e:
+            # Not every index type has a GPU implementation (HNSW does not)
+            logger.warning("Keeping FAISS index on CPU", error=str(e))
+            return index
+
+    def _save_local(self, path: str):
+        """Saves the vector store, copying a GPU index back to the CPU for serialization."""
+        index = self.vector_store.index
+        on_gpu = self.gpu_resources is not None and isinstance(index, faiss.GpuIndex)
+        if on_gpu:
+            self.vector_store.index = faiss.index_gpu_to_cpu(index)
+        staging = tempfile.mkdtemp(prefix=".staging-", dir=path)
+        try:
+            self.vector_store.save_local(staging)
+            # Renames are atomic: readers never see a half-written file, and processes that
+            # memory-mapped the old index keep its inode. The docstore goes first because it
+            # only grows and _read_local reads the index before it, so every id resolves
+            for name in ("index.pkl", "index.faiss"):
+                os.replace(os.path.join(staging, name), os.path.join(path, name))
+        finally:
+            if on_gpu:
+                self.vector_store.index = index
+            shutil.rmtree(staging, ignore_errors=True)
 
     async def save_vector_store(self, path: str):
         """Saves the vector store to the specified local path."""
         if self.vector_store is None:
             raise ValueError("Vector store has not been created yet.")
         os.makedirs(path, exist_ok=True)
-        await asyncio.to_thread(self.vector_store.save_local, path)
+        await asyncio.to_thread(self._save_local, path)
         logger.info("Vector store saved", path=path)
 
-    async def load_vector_store(self, path: str):
-        """Loads the vector store from the specified local path."""
+    async def load_vector_store(self, path: str, writable: bool = False):
+        """Loads the vector store from the specified local path; `writable` skips memory-mapping."""
         try:
             # Check if the vector store exists before trying to load it
             if not await self.vector_store_exists(path):
                 raise FileNotFoundError(f"No vector store found at {path}")
 
-            # Use asyncio.to_thread to call the synchronous FAISS load_local method asynchronously
+            # Read the index off the event loop
             self.vector_store = await asyncio.to_thread(
-                FAISS.load_local,
-                path,
-                self.embeddings,
-                allow_dangerous_deserialization=True,
+                self._read_local, path, writable
             )
+            self.vector_store_version += 1
+            self.query_cache.clear()
 
             logger.info("Vector store loaded successfully", path=path)
         except Exception as e:
             logger.error("Error loading vector store", error=str(e))
             raise
 
-    async def query(self, query_text: str) -> str:
-        """Queries the vector store with a text input and returns the results."""
-        if query_text in self.query_cache:
-            logger.info("Query result found in cache", query_text=query_text)
-            return self.query_cache[query_text]
+    def _read_local(self, path: str, writable: bool = False) -> FAISS:
+        """Reads a saved vector store, memory-mapping IVF inverted lists read-only if enabled."""
+        # Equivalent to FAISS.load_local. FAISS only maps the inverted lists of IVF indexes,
+        # which then stay in the page cache and are shared between processes; flat and HNSW
+        # indexes are copied onto the heap whatever the flags, so they are read plainly.
+        # A store that will have documents added to it needs its own writable copy
+        mmap = (
+            self.config.FAISS_MMAP
+            and not writable
+            and self.config.FAISS_INDEX_TYPE.lower().startswith("ivf")
+        )
+        io_flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if mmap else 0
+        index = faiss.read_index(os.path.join(path, "index.faiss"), io_flags)
+        with open(os.path.join(path, "index.pkl"), "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+
+        if isinstance(index, faiss.IndexHNSW):
+            index.hnsw.efSearch = self.config.FAISS_HNSW_EF_SEARCH
+        elif isinstance(index, faiss.IndexIVF):
+            index.nprobe = self.config.FAISS_IVF_NPROBE
+            index.parallel_mode = 1
+
+        if index.metric_type != faiss.METRIC_INNER_PRODUCT:
+            if index.ntotal:
+                return self._rebuild_legacy(docstore, index_to_docstore_id, path)
+            # Nothing to re-embed; L2 over the unit vectors added later ranks like cosine
+            return FAISS(self.embeddings, index, docstore, index_to_docstore_id)
+        return FAISS(
+            self.embeddings,
+            self._to_gpu(index),
+            docstore,
+            index_to_docstore_id,
+            distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT,
+        )
+
+    def _rebuild_legacy(
+        self, docstore: InMemoryDocstore, index_to_docstore_id: Dict[int, str], path: str
+    ) -> FAISS:
+        """Re-embeds a legacy L2 store's documents into a new inner-product store."""
+        # Stores saved before the switch to inner-product indexes hold unnormalized vectors
+        # under L2. Searching them with normalized queries, or appending unit vectors to
+        # them, would silently mix two scales, so their documents are embedded afresh; the
+        # next save replaces the legacy files, and the embedding cache makes repeats cheap
+        logger.warning("Rebuilding legacy L2 vector store", path=path)
+        documents = [
+            docstore.search(index_to_docstore_id[i])
+            for i in range(len(index_to_docstore_id))
+        ]
+        texts = [document.page_content for document in documents]
+        metadatas = [document.metadata for document in documents]
+        embeddings = self.embeddings.embed_documents(texts)
+        return self._build_store(texts, embeddings, metadatas)
+
+    async def query(
+        self, query_text: str, query_vector: Optional[np.ndarray] = None
+    ) -> List[Dict[str, Any]]:
+        """Queries the vector store, coalescing concurrent calls into one batched search.
+
+        A `query_vector` already computed for the normalized text is searched as-is.
+        """
+        # The normalized text is also what gets searched, so a cached entry is exactly
+        # what a fresh search for the key would return
+        query_text = normalize_query(query_text)
+        version = self.vector_store_version
+        context = self._cached_context(query_text, version)
+        if context is not None:
+            return context
+
+        # Queries arriving within the batching window share one encode and one FAISS search
+        context = await self.query_batcher.submit((query_text, query_vector))
+
+        # Cache the query results, stamped with the store version they came from
+        self.query_cache[query_text] = (version, context)
+        return context
+
+    def _cached_context(self, query_text: str, version: int):
+        """Returns the cached context for a normalized query, or None on a miss."""
+        cached = self.query_cache.get(query_text)
+        if cached is not None:
+            if cached[0] == version:
+                logger.info("Query result found in cache", query_text=query_text)
+                return cached[1]
+            # Retrieved from a store that has since been replaced
+            self.query_cache.pop(query_text, None)
 
         if self.vector_store is None:
             logger.error("Vector store not created or loaded")
             raise ValueError("Vector store has not been created or loaded yet.")
+        return None
+
+    def query_batch(
+        self, queries: List[Tuple[str, Optional[np.ndarray]]]
+    ) -> List[List[Dict[str, Any]]]:
+        """Embeds a batch of queries in one encode call and searches them in one FAISS call."""
+        vector_store = self.vector_store
+        if vector_store is None:
+            logger.error("Vector store not created or loaded")
+            raise ValueError("Vector store has not been created or loaded yet.")
 
-        logger.info("Querying vector store", query_text=query_text)
-        results = await self.vector_store.asimilarity_search(query_text, k=3)
+        logger.info("Querying vector store", batch_size=len(queries))
+        # Only queries without a precomputed vector go through the encoder
+        missing = [text for text, vector in queries if vector is None]
+        computed = iter(self.embeddings.embed_queries(missing) if missing else ())
+        vectors = np.vstack(
+            [next(computed) if vector is None else vector for _, vector in queries]
+        ).astype("float32", copy=False)
+        _, indices = vector_store.index.search(vectors, QUERY_TOP_K)
+
+        contexts = []
+        for row in indices:
+            results = [
+                vector_store.docstore.search(vector_store.index_to_docstore_id[i])
+                for i in row
+                if i != -1
+            ]
+            contexts.append(self._process_results(results))
+        return contexts
+
+    def _process_results(self, results: List[Document]) -> List[Dict[str, Any]]:
+        """Converts retrieved documents into the context items consumed by the LLM handler."""
         processed_results = []
 
         for doc in results:
@@ -130,16 +492,32 @@ class VectorStoreService:
                             "header": doc.metadata.get("header", ""),
                         }
                     )
+                elif doc.metadata.get("format") == "rows":
+                    # Rows were rendered as text at parse time; hand them over unparsed
+                    processed_results.append(
+                        {
+                            "type": "table",
+                            "headers": doc.metadata.get("headers", []),
+                            "rows": doc.page_content,
+                        }
+                    )
                 elif doc.metadata.get("type") == "table":
+                    # Stores built before row-formatted tables hold the rows as JSON. The
+                    # docstore hands back its own Document, so the parsed rows are kept in
+                    # its metadata and each table is decoded once, not on every hit
+                    data = doc.metadata.get("data")
+                    if data is None:
+                        data = (
+                            orjson.loads(doc.page_content)
+                            if isinstance(doc.page_content, str)
+                            else doc.page_content
+                        )
+                        doc.metadata["data"] = data
                     processed_results.append(
                         {
                             "type": "table",
                             "headers": doc.metadata.get("headers", []),
-                            "data": (
-                                json.loads(doc.page_content)
-                                if isinstance(doc.page_content, str)
-                                else doc.page_content
-                            ),
+                            "data": data,
                         }
                     )
                 else:
@@ -149,16 +527,13 @@ class VectorStoreService:
                     processed_results.append(
                         {"type": "unknown", "content": doc.page_content}
                     )
-            except json.JSONDecodeError:
+            except orjson.JSONDecodeError:
                 logger.error("Failed to parse JSON for document", metadata=doc.metadata)
             except Exception as e:
                 logger.error("Error processing document", error=str(e))
 
-        # Cache the query results
-        self.query_cache[query_text] = json.dumps(processed_results)
-
         logger.debug("Processed query results", results=processed_results)
-        return json.dumps(processed_results)
+        return processed_results
 
     async def load_or_create_vector_store(self, pdf_path: str):
         """Loads or creates a vector store from the PDF located at the given path."""
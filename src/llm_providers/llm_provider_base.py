@@ -1,14 +1,33 @@
 from abc import ABC, abstractmethod
+from typing import AsyncIterator
+
+# Assumed for models whose context window the provider does not know
+DEFAULT_CONTEXT_WINDOW = 4096
 
 
 class LLMProviderBase(ABC):
     """Abstract base class for all LLM providers."""
 
     @abstractmethod
-    def generate_response(self, prompt: str) -> str:
-        """Generates a response from the LLM based on the input prompt."""
+    async def generate_response(self, prompt: str) -> str:
+        """Generates a response from the LLM based on the input prompt without blocking the event loop.
+
+        Failures raise LLMError rather than returning an error message as the response.
+        """
         pass
 
+    async def generate_response_stream(self, prompt: str) -> AsyncIterator[str]:
+        """Yields the response in chunks as it is generated; by default, as a single chunk."""
+        yield await self.generate_response(prompt)
+
+    def get_context_window(self) -> int:
+        """Returns the model's context window in tokens; a set CONTEXT_WINDOW overrides it."""
+        return self.config.CONTEXT_WINDOW or self.model_context_window()
+
+    def model_context_window(self) -> int:
+        """Returns the context window the configured model is known to have."""
+        return DEFAULT_CONTEXT_WINDOW
+
     @abstractmethod
     def get_model_name(self) -> str:
         """Returns the name of the model used by the LLM provider."""
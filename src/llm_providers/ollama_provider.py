@@ -1,14 +1,22 @@
 # src/llm_providers/ollama_provider.py
 
+from typing import AsyncIterator
+from functools import lru_cache
 from langchain_community.llms import Ollama
 import structlog
 from src.config import Config
 from src.llm_providers.llm_provider_base import LLMProviderBase
-import asyncio
+from src.utils.error_handler import LLMError
 
 logger = structlog.get_logger(__name__)
 
 
+@lru_cache(maxsize=4)
+def _ollama_llm(model_name: str, base_url: str) -> Ollama:
+    """Returns the process-wide Ollama client for a model and server."""
+    return Ollama(model=model_name, base_url=base_url)
+
+
 class OllamaProvider(LLMProviderBase):
     """LLM provider for interacting with the Ollama language model."""
 
@@ -22,21 +30,34 @@ class OllamaProvider(LLMProviderBase):
             "Initializing Ollama", model=self.model_name, base_url=self.base_url
         )
 
-        self.llm = Ollama(model=self.model_name, base_url=self.base_url)
+        self.llm = _ollama_llm(self.model_name, self.base_url)
 
     async def generate_response(self, prompt: str) -> str:
         """Sends a prompt to the Ollama model and returns the generated response."""
         logger.info("Sending prompt to Ollama", prompt_preview=prompt[:100])
 
         try:
-            response = await asyncio.to_thread(self.llm.invoke, prompt)
+            # Native coroutine over an async HTTP session, so no executor thread per call
+            response = await self.llm.ainvoke(prompt)
             logger.info(
                 "Received response from Ollama", response_preview=response[:100]
             )
             return response.strip()
         except Exception as e:
             logger.error("Error generating response from Ollama", error=str(e))
-            return f"Error generating response: {str(e)}"
+            raise LLMError(f"Error generating response: {str(e)}") from e
+
+    async def generate_response_stream(self, prompt: str) -> AsyncIterator[str]:
+        """Streams the response from the Ollama model token by token."""
+        logger.info("Streaming prompt to Ollama", prompt_preview=prompt[:100])
+
+        try:
+            # Served with stream=true, so the first token arrives as soon as it is decoded
+            async for token in self.llm.astream(prompt):
+                yield token
+        except Exception as e:
+            logger.error("Error streaming response from Ollama", error=str(e))
+            raise LLMError(f"Error generating response: {str(e)}") from e
 
     def get_model_name(self) -> str:
         """Returns the name of the model used by Ollama."""
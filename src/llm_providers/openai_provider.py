@@ -1,12 +1,55 @@
 # src/llm_providers/openai_provider.py
 
-from openai import OpenAI
+from openai import AsyncOpenAI
+from functools import lru_cache
+from typing import Callable
 import logging
 from src.config import Config
 from src.llm_providers.llm_provider_base import LLMProviderBase
+from src.utils.error_handler import LLMError
 
 logger = logging.getLogger(__name__)
 
+SYSTEM_PROMPT = "You are a helpful assistant."
+MAX_RESPONSE_TOKENS = 150
+# Prompts leaving less room than this for the answer are rejected before any request
+MIN_RESPONSE_TOKENS = 32
+# Per-message framing tokens the chat format adds on top of the message contents
+MESSAGE_OVERHEAD_TOKENS = 8
+# Rough size of an English token, used when tiktoken is not installed
+CHARS_PER_TOKEN = 4
+
+# Context windows by model-name prefix, most specific first
+_CONTEXT_WINDOWS = (
+    ("gpt-4o", 128000),
+    ("gpt-4-turbo", 128000),
+    ("gpt-4-32k", 32768),
+    ("gpt-4", 8192),
+    ("gpt-3.5-turbo-instruct", 4096),
+    ("gpt-3.5-turbo", 16385),
+)
+
+
+@lru_cache(maxsize=4)
+def _openai_client(api_key: str) -> AsyncOpenAI:
+    """Returns the process-wide client for an API key, so its connection pool is reused."""
+    return AsyncOpenAI(api_key=api_key, timeout=30.0, max_retries=2)
+
+
+@lru_cache(maxsize=4)
+def _token_counter(model: str) -> Callable[[str], int]:
+    """Returns a prompt token counter for a model, estimated from length without tiktoken."""
+    # Pinned in requirements.txt; without it the count is only an estimate
+    try:
+        import tiktoken
+    except ImportError:
+        return lambda text: len(text) // CHARS_PER_TOKEN + 1
+    try:
+        encoding = tiktoken.encoding_for_model(model)
+    except KeyError:
+        encoding = tiktoken.get_encoding("cl100k_base")
+    return lambda text: len(encoding.encode(text))
+
 
 class OpenAIProvider(LLMProviderBase):
     """LLM provider for interacting with the OpenAI language model."""
@@ -14,25 +57,42 @@ class OpenAIProvider(LLMProviderBase):
     def __init__(self, config: Config):
         """Initializes the OpenAI provider with configuration and API key."""
         self.config = config
-        self.client = OpenAI(api_key=self.config.OPENAI_API_KEY)
+        self.client = _openai_client(self.config.OPENAI_API_KEY)
         self.model = self.config.OPENAI_MODEL_NAME
+        self.count_tokens = _token_counter(self.model)
+        self.context_window = self.get_context_window()
 
         logger.info(f"Initializing OpenAI with model: {self.model}")
 
-    def generate_response(self, prompt: str) -> str:
+    async def generate_response(self, prompt: str) -> str:
         """Sends a prompt to the OpenAI model and returns the generated response."""
         logger.info(
             f"Sending prompt to OpenAI: {prompt[:100]}..."
         )  # Log first 100 characters of prompt
 
+        prompt_tokens = (
+            self.count_tokens(SYSTEM_PROMPT)
+            + self.count_tokens(prompt)
+            + 2 * MESSAGE_OVERHEAD_TOKENS
+        )
+        available = self.context_window - prompt_tokens
+        if available < MIN_RESPONSE_TOKENS:
+            # The API would reject it or cut the answer short, after billing the prompt
+            logger.warning(
+                f"Prompt of {prompt_tokens} tokens leaves too little of the "
+                f"{self.context_window}-token context window for an answer"
+            )
+            raise LLMError("The prompt is too long for the model's context window")
+
+        logger.debug(f"OpenAI prompt size: {prompt_tokens} tokens")
         try:
-            response = self.client.chat.completions.create(
+            response = await self.client.chat.completions.create(
                 model=self.model,
                 messages=[
-                    {"role": "system", "content": "You are a helpful assistant."},
+                    {"role": "system", "content": SYSTEM_PROMPT},
                     {"role": "user", "content": prompt},
                 ],
-                max_tokens=150,
+                max_tokens=min(MAX_RESPONSE_TOKENS, available),
             )
             result = response.choices[0].message.content.strip()
             logger.info(
@@ -41,7 +101,18 @@ class OpenAIProvider(LLMProviderBase):
             return result
         except Exception as e:
             logger.error(f"Error generating response from OpenAI: {str(e)}")
-            return f"Error generating response: {str(e)}"
+            raise LLMError(f"Error generating response: {str(e)}") from e
+
+    def model_context_window(self) -> int:
+        """Returns the context window of the configured OpenAI model."""
+        return next(
+            (
+                window
+                for prefix, window in _CONTEXT_WINDOWS
+                if self.model.startswith(prefix)
+            ),
+            super().model_context_window(),
+        )
 
     def get_model_name(self) -> str:
         """Returns the name of the model used by OpenAI."""
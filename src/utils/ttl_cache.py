@@ -0,0 +1,72 @@
+# src/utils/ttl_cache.py
+
+from collections import OrderedDict
+from typing import Any, Hashable, Tuple
+import time
+
+
+class TTLLRUCache:
+    """Size-bounded LRU mapping whose entries expire `ttl` seconds after their last use."""
+
+    def __init__(self, maxsize: int, ttl: float, sweep_interval: float = 60):
+        """
+        Initialize the TTLLRUCache.
+
+        Expiry is checked only for the entry being read; a full sweep of expired entries runs
+        at most once per `sweep_interval` seconds, on a write, so hits stay O(1).
+
+        Args:
+            maxsize (int): Maximum number of entries before the least recently used is evicted.
+            ttl (float): Seconds an entry stays valid after it was last written or read.
+            sweep_interval (float): Minimum seconds between sweeps of expired entries.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._next_sweep = time.monotonic() + sweep_interval
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the value for a live key, refreshing its recency and expiry."""
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        now = time.monotonic()
+        if entry[0] <= now:
+            del self._data[key]
+            return default
+        self._data[key] = (now + self.ttl, entry[1])
+        self._data.move_to_end(key)
+        return entry[1]
+
+    def __setitem__(self, key: Hashable, value: Any):
+        now = time.monotonic()
+        self._data[key] = (now + self.ttl, value)
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+        if now >= self._next_sweep:
+            self._sweep(now)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Remove a key, returning its value whether or not it had expired."""
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _sweep(self, now: float):
+        """Drop expired entries from the least recently used end."""
+        # Every use moves an entry to the end and pushes its expiry out by the same ttl,
+        # so entries are ordered by expiry and the sweep can stop at the first live one
+        data = self._data
+        while data:
+            key, (expires, _) = next(iter(data.items()))
+            if expires > now:
+                break
+            del data[key]
+        self._next_sweep = now + self.sweep_interval